@@ -0,0 +1,336 @@
+"""
+Batch comparison of many document pairs.
+
+    python batch.py manifest.json --output-dir results/
+    python batch.py --directory versions/ --output-dir results/ --ai
+
+A manifest is a JSON list (or {"pairs": [...]}) of {"id": ..., "old": path, "new": path}
+entries, with paths relative to the manifest. A directory holds one folder of versions
+per regulation; files sorted by name are successive versions and each is compared with
+the one before it. Every pair gets <output-dir>/<n>_<id>.json and the run a summary.json.
+
+Identical documents are kept once, identical pairs are compared once, and a section
+change or added section shared by several pairs gets one paragraph diff and one LLM
+analysis, which every pair reuses.
+"""
+import argparse
+import asyncio
+import json
+import os
+import posixpath
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from config import BATCH_WORKERS, LLM_CACHE_BYPASS, TRIAGE_ENABLED
+from difference_utility import (
+    changed_section_records,
+    generate_cache_key,
+    hash_document,
+    section_result,
+)
+from executors import run_blocking_io, shutdown_pools
+from llm_utility import analyze_added_sections, analyze_modified_sections
+from metrics import span
+from pipeline import (
+    added_section_result,
+    analyze_paragraphs_parallel,
+    diff_only_results,
+    get_comparison,
+    modified_section_result,
+    paragraph_counts,
+    section_counts,
+)
+from triage import triage_modified_sections
+
+class BatchPair(NamedTuple):
+    pair_id: str
+    old_name: str
+    new_name: str
+    old_text: str
+    new_text: str
+
+# (pair_id, old_name, new_name) before the documents are loaded
+PairEntry = Tuple[str, str, str]
+
+def manifest_entries(manifest: Any) -> List[PairEntry]:
+    """Validated entries of a parsed manifest; a missing id becomes "old->new" """
+    pairs = manifest.get("pairs") if isinstance(manifest, dict) else manifest
+    if not isinstance(pairs, list):
+        raise ValueError('Manifest must be a list of pairs or {"pairs": [...]}')
+
+    entries = []
+    for index, pair in enumerate(pairs):
+        if not isinstance(pair, dict) or not isinstance(pair.get("old"), str) or not isinstance(pair.get("new"), str):
+            raise ValueError(f'Manifest entry {index} needs "old" and "new" document names')
+        entries.append((str(pair.get("id") or f"{pair['old']}->{pair['new']}"), pair["old"], pair["new"]))
+
+    pair_ids = [pair_id for pair_id, _, _ in entries]
+    duplicates = sorted({pair_id for pair_id in pair_ids if pair_ids.count(pair_id) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate pair ids in manifest: {duplicates}")
+    return entries
+
+def _natural_key(name: str) -> List[Any]:
+    """Sort key that orders v2 before v10"""
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", name)]
+
+def version_entries(names: Iterable[str]) -> List[PairEntry]:
+    """
+    Pairs of successive versions from "/"-separated relative file names: files in the same
+    folder are versions of one regulation, ordered by name
+    """
+    groups: Dict[str, List[str]] = {}
+    for name in names:
+        groups.setdefault(posixpath.dirname(name), []).append(name)
+
+    entries = []
+    for group in sorted(groups):
+        versions = sorted(groups[group], key=_natural_key)
+        for old_name, new_name in zip(versions, versions[1:]):
+            pair_id = f"{posixpath.basename(old_name)}->{posixpath.basename(new_name)}"
+            entries.append((f"{group}/{pair_id}" if group else pair_id, old_name, new_name))
+    return entries
+
+def load_pairs(entries: List[PairEntry], load: Callable[[str], str]) -> List[BatchPair]:
+    """Load each distinct document once; identical documents share one string"""
+    names: Dict[str, str] = {}
+    texts: Dict[str, str] = {}
+    for _, old_name, new_name in entries:
+        for name in (old_name, new_name):
+            if name not in names:
+                text = load(name)
+                names[name] = texts.setdefault(hash_document(text), text)
+    return [
+        BatchPair(pair_id, old_name, new_name, names[old_name], names[new_name])
+        for pair_id, old_name, new_name in entries
+    ]
+
+async def _compare_all(pairs: List[BatchPair], workers: int, progress: Callable[[], None]) -> Dict[str, Any]:
+    """Section comparison per distinct pair, at most `workers` at a time; failures are kept as exceptions"""
+    unique = {generate_cache_key(pair.old_text, pair.new_text): pair for pair in pairs}
+    slots = asyncio.Semaphore(workers)
+
+    async def compare(pair: BatchPair):
+        async with slots:
+            try:
+                return await get_comparison(pair.old_text, pair.new_text)
+            except Exception as e:
+                return e
+            finally:
+                progress()
+
+    results = await asyncio.gather(*(compare(pair) for pair in unique.values()))
+    return dict(zip(unique, results))
+
+def _modified_rounds(keys: Iterable[Tuple[str, str, str]]) -> List[Dict[str, Tuple[str, str, str]]]:
+    """
+    Split (section_id, old_fingerprint, new_fingerprint) keys into {section_id: key} rounds,
+    since the same section id may change differently in different pairs
+    """
+    rounds: List[Dict[str, Tuple[str, str, str]]] = []
+    for key in keys:
+        for keys_by_id in rounds:
+            if key[0] not in keys_by_id:
+                keys_by_id[key[0]] = key
+                break
+        else:
+            rounds.append({key[0]: key})
+    return rounds
+
+async def run_batch(
+    pairs: List[BatchPair],
+    ai: bool = False,
+    diff_only: bool = False,
+    bypass_cache: bool = LLM_CACHE_BYPASS,
+    workers: int = BATCH_WORKERS,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Dict[str, Any]:
+    """
+    Compare every pair and return {"summary": ..., "pairs": [...]} with per-pair sections,
+    paragraphs and, with ai, added_ai and modified_ai in the shapes of the single-pair
+    endpoints. A pair whose comparison fails is reported with its error.
+    progress(done, total) is called as comparisons and LLM analyses finish.
+    """
+    start = time.perf_counter()
+    done, total = 0, len({generate_cache_key(pair.old_text, pair.new_text) for pair in pairs})
+
+    def advance(count: int = 1) -> None:
+        nonlocal done
+        done += count
+        if progress is not None:
+            progress(done, total)
+
+    with span('batch', pairs=len(pairs)) as attributes:
+        comparisons = await _compare_all(pairs, workers, advance)
+        compared = {key: comparison for key, comparison in comparisons.items() if isinstance(comparison, dict)}
+
+        # Changed and added sections of all pairs, keyed by content so shared ones are analyzed once
+        changed = {
+            key: [
+                ((old_section.fingerprint, new_section.fingerprint), section_id, old_section, new_section)
+                for section_id, old_section, new_section in changed_section_records(comparison)
+            ]
+            for key, comparison in compared.items()
+        }
+        unique_changed = {}
+        for sections in changed.values():
+            for fingerprints, _, old_section, new_section in sections:
+                unique_changed.setdefault(fingerprints, (old_section, new_section))
+        paragraph_results = await analyze_paragraphs_parallel([
+            (":".join(fingerprints), old_section.content, new_section.content)
+            for fingerprints, (old_section, new_section) in unique_changed.items()
+        ])
+
+        added_analyses: Dict[Tuple[str, str], Dict] = {}
+        modified_analyses: Dict[Tuple[str, str, str], Dict] = {}
+        triaged = 0
+        if ai:
+            unique_added = {}
+            for comparison in compared.values():
+                for section in comparison['added_sections']:
+                    unique_added.setdefault((section.title, section.fingerprint), section)
+            unique_modified = {}
+            for sections in changed.values():
+                for fingerprints, section_id, old_section, new_section in sections:
+                    unique_modified.setdefault(
+                        (section_id, *fingerprints), {'old': old_section.content, 'new': new_section.content}
+                    )
+            total += len(unique_added) + len(unique_modified)
+            advance(0)
+
+            with span('added_ai', sections=len(unique_added)):
+                analyses = await run_blocking_io(
+                    analyze_added_sections, list(unique_added.values()), bypass_cache=bypass_cache
+                )
+            added_analyses = dict(zip(unique_added, analyses))
+            advance(len(unique_added))
+
+            for keys in _modified_rounds(unique_modified):
+                modified = {section_id: unique_modified[key] for section_id, key in keys.items()}
+                substantive, cosmetic = modified, {}
+                if TRIAGE_ENABLED:
+                    substantive, cosmetic = triage_modified_sections(modified, {
+                        section_id: paragraph_results[":".join(key[1:])] for section_id, key in keys.items()
+                    })
+                triaged += len(cosmetic)
+                with span('modified_ai', sections=len(substantive)):
+                    results = await run_blocking_io(
+                        analyze_modified_sections, substantive, bypass_cache=bypass_cache
+                    )
+                for section_id, key in keys.items():
+                    modified_analyses[key] = results[section_id] if section_id in results else cosmetic[section_id]
+                advance(len(keys))
+
+        pair_results = []
+        for pair in pairs:
+            entry: Dict[str, Any] = {"pair_id": pair.pair_id, "old": pair.old_name, "new": pair.new_name}
+            comparison = comparisons[generate_cache_key(pair.old_text, pair.new_text)]
+            if not isinstance(comparison, dict):
+                pair_results.append({**entry, "status": "failed", "error": str(comparison)})
+                continue
+
+            sections = changed[generate_cache_key(pair.old_text, pair.new_text)]
+            paragraphs = {
+                section_id: paragraph_results[":".join(fingerprints)]
+                for fingerprints, section_id, _, _ in sections
+            }
+            if diff_only:
+                paragraphs = diff_only_results(paragraphs)
+            entry.update(
+                status="done",
+                counts={**section_counts(comparison), **paragraph_counts(paragraphs), "modified_sections": len(sections)},
+                sections=section_result(comparison).model_dump(),
+                paragraphs={section_id: result.model_dump() for section_id, result in paragraphs.items()}
+            )
+            if ai:
+                entry["added_ai"] = [
+                    added_section_result(section, added_analyses[(section.title, section.fingerprint)])
+                    for section in comparison['added_sections']
+                ]
+                # Analyses are shared between pairs, so each pair enriches its own copy
+                entry["modified_ai"] = {
+                    section_id: modified_section_result(
+                        {'old': old_section.content, 'new': new_section.content},
+                        dict(modified_analyses[(section_id, *fingerprints)])
+                    )
+                    for fingerprints, section_id, old_section, new_section in sections
+                }
+            pair_results.append(entry)
+
+        summary = {
+            "pairs": len(pairs),
+            "failed": sum(1 for entry in pair_results if entry["status"] == "failed"),
+            "documents": len({hash_document(text) for pair in pairs for text in (pair.old_text, pair.new_text)}),
+            "comparisons": len(comparisons),
+            "changed_sections": sum(entry["counts"]["modified_sections"] for entry in pair_results if entry["status"] == "done"),
+            "unique_changed_sections": len(unique_changed),
+            "llm_analyses": len(added_analyses) + len(modified_analyses) - triaged,
+            "llm_calls_skipped": triaged,
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+        attributes.update(comparisons=summary["comparisons"], unique_changed_sections=summary["unique_changed_sections"])
+    return {"summary": summary, "pairs": pair_results}
+
+def _output_name(index: int, pair_id: str) -> str:
+    return f"{index:03d}_{re.sub(r'[^A-Za-z0-9._]+', '_', pair_id)}.json"
+
+def write_results(results: Dict[str, Any], output_dir: str) -> None:
+    """One JSON file per pair plus summary.json listing each pair's status and file"""
+    os.makedirs(output_dir, exist_ok=True)
+    files = []
+    for index, entry in enumerate(results["pairs"], 1):
+        name = _output_name(index, entry["pair_id"])
+        with open(os.path.join(output_dir, name), "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2)
+        files.append({"pair_id": entry["pair_id"], "status": entry["status"], "file": name, "error": entry.get("error")})
+    with open(os.path.join(output_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump({**results["summary"], "results": files}, f, indent=2)
+
+def _read_text(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def _directory_names(directory: str) -> List[str]:
+    """Relative "/"-separated names of the files under directory, skipping hidden ones"""
+    names = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for name in files:
+            if not name.startswith("."):
+                names.append(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/"))
+    return names
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare many document pairs")
+    parser.add_argument("manifest", nargs="?", help="JSON manifest of {id, old, new} pairs")
+    parser.add_argument("--directory", help="folders of successive versions, one per regulation")
+    parser.add_argument("--output-dir", default="batch_results")
+    parser.add_argument("--ai", action="store_true", help="also run the LLM analyses")
+    parser.add_argument("--diff-only", action="store_true", help="omit new_paragraph from modified paragraphs")
+    parser.add_argument("--bypass-cache", action="store_true", default=LLM_CACHE_BYPASS)
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="pairs compared concurrently")
+    args = parser.parse_args()
+    if bool(args.manifest) == bool(args.directory):
+        parser.error("give either a manifest or --directory")
+
+    if args.manifest:
+        with open(args.manifest, encoding="utf-8") as f:
+            entries = manifest_entries(json.load(f))
+        base = os.path.dirname(os.path.abspath(args.manifest))
+    else:
+        entries = version_entries(_directory_names(args.directory))
+        base = args.directory
+    pairs = load_pairs(entries, lambda name: _read_text(os.path.join(base, name)))
+
+    try:
+        results = asyncio.run(run_batch(pairs, args.ai, args.diff_only, args.bypass_cache, args.workers))
+    finally:
+        shutdown_pools()
+    write_results(results, args.output_dir)
+    print(json.dumps(results["summary"], indent=2))
+    return 1 if results["summary"]["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from config import COMPARISON_CACHE_SIZE, COMPARISON_CACHE_TTL
+
+class ComparisonCache:
+    """
+    Bounded in-process LRU cache with per-entry TTL and hit/miss counters.
+    With max_bytes set, entries are also evicted once their sys.getsizeof total exceeds it
+    (a shallow size, so meant for flat values such as strings); the newest entry is always kept.
+    """
+
+    def __init__(self, max_size: int = COMPARISON_CACHE_SIZE, ttl: Optional[float] = COMPARISON_CACHE_TTL,
+                 max_bytes: Optional[int] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, stored_at: float) -> bool:
+        return bool(self.ttl) and time.monotonic() - stored_at > self.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1]):
+                if entry is not None:
+                    del self._entries[key]
+                    self.bytes -= entry[2]
+                    self.evictions += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = sys.getsizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            replaced = self._entries.get(key)
+            if replaced is not None:
+                self.bytes -= replaced[2]
+            self._entries[key] = (value, time.monotonic(), size)
+            self._entries.move_to_end(key)
+            self.bytes += size
+            while len(self._entries) > self.max_size or (
+                self.max_bytes is not None and self.bytes > self.max_bytes and len(self._entries) > 1
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted[2]
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for key, computing and storing it on a miss"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    async def get_or_compute_async(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """get_or_compute for coroutine factories, e.g. work offloaded to an executor"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = await compute()
+            self.set(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+            if self.max_bytes is not None:
+                stats.update({"bytes": self.bytes, "max_bytes": self.max_bytes})
+            return stats
+
+# Shared cache for compare_sections output and paragraph results
+comparison_cache = ComparisonCache()
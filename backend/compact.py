@@ -0,0 +1,94 @@
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from cache import ComparisonCache
+from config import COMPACT_MIN_LENGTH, CONTENT_STORE_MAX_BYTES, CONTENT_STORE_SIZE, CONTENT_STORE_TTL
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# Texts left out of compact responses, by content hash; bounded by total size as well as count,
+# since one compact response over a large document can hold most of its text
+content_store = ComparisonCache(
+    max_size=CONTENT_STORE_SIZE, ttl=CONTENT_STORE_TTL, max_bytes=CONTENT_STORE_MAX_BYTES
+)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def _reference(entry: Dict[str, Any], field: str) -> None:
+    """Replace a long text field with {"content_hash", "length"} under field + "_ref" """
+    text = entry.get(field)
+    if not isinstance(text, str) or len(text) <= COMPACT_MIN_LENGTH:
+        return
+    key = content_hash(text)
+    content_store.set(key, text)
+    entry[f"{field}_ref"] = {"content_hash": key, "length": len(text)}
+    del entry[field]
+
+def _reference_all(entries: Iterable[Dict[str, Any]], *fields: str) -> None:
+    for entry in entries:
+        for field in fields:
+            _reference(entry, field)
+
+# Compactors take the JSON-ready response and replace long texts in place
+
+def compact_sections(data: Dict[str, Any]) -> Dict[str, Any]:
+    _reference_all(data["added_sections"] + data["deleted_sections"], "content")
+    return data
+
+def compact_paragraphs(data: Dict[str, Any]) -> Dict[str, Any]:
+    for result in data.values():
+        for change in result["modified_paragraphs"]:
+            # old_paragraph plus the word-level diff reproduce it
+            if change.get("diff") is not None:
+                change.pop("new_paragraph", None)
+        _reference_all(result["added_paragraphs"], "new_paragraph")
+        _reference_all(result["deleted_paragraphs"] + result["modified_paragraphs"], "old_paragraph")
+    return data
+
+def compact_added_ai(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    _reference_all(data, "section_content")
+    return data
+
+def compact_modified_ai(data: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    _reference_all(data.values(), "old_content", "new_content")
+    return data
+
+def accepts_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return msgpack is not None and any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+def encode_response(
+    request: Request,
+    data: Any,
+    compactor: Optional[Callable[[Any], Any]] = None,
+    response: Optional[Response] = None
+) -> Any:
+    """
+    Serialize a result as the client asked: compacted when a compactor is given, and as
+    msgpack when the Accept header names it and msgpack is installed. Otherwise data is
+    returned as is for the endpoint's response_model to validate and render as JSON.
+    Headers already set on the endpoint's injected `response` are carried over.
+    """
+    binary = accepts_msgpack(request)
+    if compactor is None and not binary:
+        return data
+
+    data = jsonable_encoder(data)
+    if compactor is not None:
+        data = compactor(data)
+    headers = {"Vary": "Accept"}
+    if response is not None:
+        headers.update({key: value for key, value in response.headers.items() if key != "content-length"})
+    if binary:
+        return Response(msgpack.packb(data), media_type=MSGPACK_MEDIA_TYPES[0], headers=headers)
+    return JSONResponse(data, headers=headers)
@@ -0,0 +1,112 @@
+import os
+
+# Backend settings, overridable through environment variables
+
+# Comparison cache
+COMPARISON_CACHE_SIZE = int(os.getenv("COMPARISON_CACHE_SIZE", "32"))
+COMPARISON_CACHE_TTL = float(os.getenv("COMPARISON_CACHE_TTL", "3600"))  # seconds
+
+# LLM analysis
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))  # parallel Ollama requests
+
+# Persistent LLM response cache
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite3")
+)
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+# A hit only rewrites an entry's last-access time once it is older than this, in seconds
+LLM_CACHE_TOUCH_INTERVAL = float(os.getenv("LLM_CACHE_TOUCH_INTERVAL", "60"))
+
+# Paragraph similarity: auto, levenshtein, rapidfuzz or difflib
+SIMILARITY_BACKEND = os.getenv("SIMILARITY_BACKEND", "auto")
+
+# Worker pools: processes for CPU-bound diffing (0 runs it on the thread pool), threads for blocking I/O
+DIFF_PROCESS_WORKERS = int(os.getenv("DIFF_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+IO_THREAD_WORKERS = int(os.getenv("IO_THREAD_WORKERS", "32"))
+
+# Parallel paragraph analysis across sections
+PARALLEL_PARAGRAPHS = os.getenv("PARALLEL_PARAGRAPHS", "1") == "1"
+PARALLEL_PARAGRAPHS_MIN_SECTIONS = int(os.getenv("PARALLEL_PARAGRAPHS_MIN_SECTIONS", "8"))
+PARAGRAPH_CHUNKS_PER_WORKER = int(os.getenv("PARAGRAPH_CHUNKS_PER_WORKER", "2"))
+
+# /analyze comparison sessions
+SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", "16"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "7200"))  # seconds
+
+# Ollama HTTP client
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", str(max(LLM_CONCURRENCY, 10))))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))  # seconds
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))  # seconds
+OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", "2"))
+OLLAMA_RETRY_BACKOFF = float(os.getenv("OLLAMA_RETRY_BACKOFF", "0.5"))  # seconds, doubled per retry
+OLLAMA_CIRCUIT_FAILURES = int(os.getenv("OLLAMA_CIRCUIT_FAILURES", "5"))  # consecutive failures to open
+OLLAMA_CIRCUIT_RESET = float(os.getenv("OLLAMA_CIRCUIT_RESET", "30"))  # seconds before a trial call
+
+# Streamed generation: stop reading once a complete JSON object has arrived
+LLM_STREAM = os.getenv("LLM_STREAM", "1") == "1"
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "256"))  # num_predict per section, 0 for the model default
+
+# Batched multi-section prompts
+LLM_BATCH_MODE = os.getenv("LLM_BATCH_MODE", "0") == "1"
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "1500"))  # prompt tokens per batch
+LLM_BATCH_MAX_SECTIONS = int(os.getenv("LLM_BATCH_MAX_SECTIONS", "12"))
+
+# Classify cosmetic-only section edits locally instead of calling the LLM
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "1") == "1"
+
+# Versioned regulation store
+VERSION_STORE_PATH = os.getenv(
+    "VERSION_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "versions.sqlite3")
+)
+
+# Streaming section splitter for large uploads
+STREAMING_UPLOAD_THRESHOLD = int(os.getenv("STREAMING_UPLOAD_THRESHOLD", str(32 * 1024 * 1024)))  # bytes
+SECTION_STREAM_CHUNK_SIZE = int(os.getenv("SECTION_STREAM_CHUNK_SIZE", str(1024 * 1024)))  # bytes per read
+SECTION_STREAM_MARGIN = int(os.getenv("SECTION_STREAM_MARGIN", "65536"))  # characters of lookahead held back
+
+# Normalized paragraphs kept for reuse across comparisons
+NORMALIZE_CACHE_SIZE = int(os.getenv("NORMALIZE_CACHE_SIZE", "8192"))
+
+# Stage timing metrics (/metrics) and optional JSON span logs on stderr
+METRICS_LOG = os.getenv("METRICS_LOG", "0") == "1"
+METRICS_BUCKETS = tuple(
+    float(bound) for bound in os.getenv(
+        "METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60"
+    ).split(",")
+)
+
+# Background AI analysis jobs
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # jobs analyzed concurrently
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))  # seconds finished jobs are kept
+JOB_MAX_JOBS = int(os.getenv("JOB_MAX_JOBS", "100"))  # retained jobs, queued and finished
+
+# Batch comparisons (/batch and batch.py)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))  # document pairs compared concurrently
+
+# Section alignment: renamed sections need this content similarity, compared on a prefix
+SECTION_RENAME_MIN_SIMILARITY = float(os.getenv("SECTION_RENAME_MIN_SIMILARITY", "0.7"))
+SECTION_SIMILARITY_CHARS = int(os.getenv("SECTION_SIMILARITY_CHARS", "2000"))
+
+# Optional semantic matching of sections left unpaired by the text alignment:
+# "off", "tfidf" (needs numpy), "embedding" (needs sentence-transformers) or "auto"
+SEMANTIC_MATCHING = os.getenv("SEMANTIC_MATCHING", "off")
+# Cosine similarity a semantic pair needs; empty uses the backend's default (tfidf 0.6, embedding 0.85)
+SEMANTIC_MIN_SIMILARITY = float(os.getenv("SEMANTIC_MIN_SIMILARITY")) if os.getenv("SEMANTIC_MIN_SIMILARITY") else None
+# Share of the shorter title's words both sections' titles must have; empty uses the backend's default (tfidf 0.5, embedding 0)
+SEMANTIC_MIN_TITLE_OVERLAP = float(os.getenv("SEMANTIC_MIN_TITLE_OVERLAP")) if os.getenv("SEMANTIC_MIN_TITLE_OVERLAP") else None
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+SEMANTIC_BLOCK_ROWS = int(os.getenv("SEMANTIC_BLOCK_ROWS", "1024"))  # old sections per similarity block
+SEMANTIC_CANDIDATES = int(os.getenv("SEMANTIC_CANDIDATES", "5"))  # nearest new sections kept per old section
+SEMANTIC_DIMENSIONS = int(os.getenv("SEMANTIC_DIMENSIONS", "256"))  # wider vectors are searched in a random projection
+
+# Compact responses: texts longer than COMPACT_MIN_LENGTH are replaced by content hashes,
+# fetched lazily from /content for CONTENT_STORE_TTL seconds
+COMPACT_MIN_LENGTH = int(os.getenv("COMPACT_MIN_LENGTH", "256"))  # characters
+CONTENT_STORE_SIZE = int(os.getenv("CONTENT_STORE_SIZE", "100000"))  # texts
+CONTENT_STORE_MAX_BYTES = int(os.getenv("CONTENT_STORE_MAX_BYTES", str(64 * 1024 * 1024)))  # total size of stored texts
+CONTENT_STORE_TTL = float(os.getenv("CONTENT_STORE_TTL", "3600"))  # seconds
+
+# Response compression for bodies of at least GZIP_MIN_SIZE bytes (0 disables it)
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
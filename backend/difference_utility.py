@@ -1,8 +1,24 @@
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, Hashable, List, Dict, Iterable, NamedTuple, Sequence, Set, Tuple, Optional, Union
+from collections import Counter, defaultdict
+import bisect
 import difflib
-import re
+import math
 import hashlib
 from pydantic import BaseModel
+from similarity import similarity_backend
+from semantic import match_semantic, semantic_backend
+from inline_diff import DiffSpan, word_diff
+from config import SECTION_RENAME_MIN_SIMILARITY, SECTION_SIMILARITY_CHARS
+from tokenizer import (
+    preprocess_text,
+    section_spans,
+    iter_sections,
+    get_section_identifier,
+    split_into_paragraphs,
+    normalize_paragraph,
+    normalize_text,
+    word_tokens,
+)
 
 class SectionChange(BaseModel):
     title: str
@@ -12,75 +28,394 @@ class ParagraphChange(BaseModel):
     old_paragraph: Optional[str] = None
     new_paragraph: Optional[str] = None
     similarity: Optional[float] = None
+    diff: Optional[List[DiffSpan]] = None  # word-level edits from old_paragraph, for modified paragraphs
+
+class SectionMove(BaseModel):
+    title: str
+    old_position: int
+    new_position: int
+
+class SectionRename(BaseModel):
+    old_title: str
+    new_title: str
+    similarity: float
+    method: str = "text"  # "text" or "semantic"
 
 class SectionComparisonResult(BaseModel):
     added_sections: List[SectionChange]
     deleted_sections: List[SectionChange]
+    moved_sections: List[SectionMove] = []
+    renamed_sections: List[SectionRename] = []
 
 class ParagraphComparisonResult(BaseModel):
     added_paragraphs: List[ParagraphChange]
     deleted_paragraphs: List[ParagraphChange]
     modified_paragraphs: List[ParagraphChange]
 
+def hash_document(text: str) -> str:
+    """Content hash identifying a single document version"""
+    return hashlib.md5(text.encode()).hexdigest()
+
 def generate_cache_key(old_text: str, new_text: str) -> str:
     """Generate a unique key for caching document comparisons"""
-    combined = old_text + new_text
-    return hashlib.md5(combined.encode()).hexdigest()
-
-def preprocess_text(text: str) -> List[str]:
-    """Split text into sections with improved header detection"""
-    sections = re.split(
-        r'\n(?=\d+\.\d*\s+[A-Z][^\n]+|\n\[SECTION|ARTICLE|\n\s*[A-Z][A-Z\s]+\n|\n\s*[IVX]+\.\s|\n\s*\(\w\)\s)',
-        text.strip()
+    return f"{hash_document(old_text)}:{hash_document(new_text)}"
+
+def section_fingerprint(content: str) -> str:
+    """Content hash of a single section"""
+    return hashlib.sha1(content.encode()).hexdigest()
+
+class SectionRecord:
+    """
+    A section as offsets into its document's text, which every section of the document
+    shares, so no section text is kept apart from the document itself. content copies the
+    text out on demand; to_model builds the API model.
+    """
+    __slots__ = ('document', 'start', 'end', 'fingerprint', 'title')
+
+    def __init__(self, document: str, start: int, end: int, fingerprint: str, title: str):
+        self.document = document
+        self.start = start
+        self.end = end
+        self.fingerprint = fingerprint
+        self.title = title
+
+    @property
+    def content(self) -> str:
+        return self.document[self.start:self.end]
+
+    def to_model(self) -> SectionChange:
+        return SectionChange(title=self.title, content=self.content)
+
+def split_sections(source: Union[str, Iterable[str]]) -> Iterable[Tuple[str, int, int]]:
+    """
+    (document, start, end) per section of a whole document string, or lazily of an
+    iterable of text chunks, where each streamed section is its own document
+    """
+    if isinstance(source, str):
+        return ((source, start, end) for start, end in section_spans(source))
+    return ((section, 0, len(section)) for section in iter_sections(source))
+
+def section_records(source: Union[str, Iterable[str]]) -> Tuple[List[SectionRecord], List[str]]:
+    """SectionRecords of a document, titled with their section_keys keys, and the raw identifiers"""
+    records = []
+    identifiers = []
+    for document, start, end in split_sections(source):
+        line_end = document.find('\n', start, end)
+        identifiers.append(get_section_identifier(document[start:line_end if line_end >= 0 else end]))
+        records.append(SectionRecord(document, start, end, section_fingerprint(document[start:end]), ''))
+    for record, key in zip(records, section_keys(identifiers)):
+        record.title = key
+    return records, identifiers
+
+def section_keys(identifiers: Sequence[str]) -> List[str]:
+    """
+    Unique key per section: its identifier, with " #n" appended from the identifier's
+    second occurrence on, so repeated headers such as "(a)" are all kept
+    """
+    seen = Counter()
+    keys = []
+    for identifier in identifiers:
+        seen[identifier] += 1
+        keys.append(identifier if seen[identifier] == 1 else f"{identifier} #{seen[identifier]}")
+    return keys
+
+def compare_sections(old_text: Union[str, Iterable[str]], new_text: Union[str, Iterable[str]]) -> Dict:
+    """
+    Identify added, deleted, moved and renamed sections between documents.
+    Either side may be an iterable of text chunks, which is split lazily.
+    Sections are SectionRecords pointing into the documents; every occurrence of a repeated
+    header is kept under its section_keys key, and matched sections are listed as
+    (old_key, new_key) pairs in new-document order. section_result builds the API model.
+    """
+    old_sections, old_identifiers = section_records(old_text)
+    new_sections, new_identifiers = section_records(new_text)
+    
+    alignment = align_sections(
+        old_identifiers, [section.fingerprint for section in old_sections],
+        new_identifiers, [section.fingerprint for section in new_sections],
+        lambda indices: (old_sections[i].content for i in indices),
+        lambda indices: (new_sections[j].content for j in indices)
     )
-    return [s.strip() for s in sections if s.strip()]
+    
+    return {
+        'added_sections': [new_sections[j] for j in alignment.added],
+        'deleted_sections': [old_sections[i] for i in alignment.deleted],
+        'moved_sections': [(new_sections[j].title, i, j) for i, j in alignment.moved],
+        'renamed_sections': [
+            (old_sections[i].title, new_sections[j].title, ratio, method)
+            for i, j, ratio, method in alignment.renamed
+        ],
+        'common_sections': [new_sections[j].title for _, j in alignment.matches],
+        'matched_sections': [(old_sections[i].title, new_sections[j].title) for i, j in alignment.matches],
+        'old_section_map': {section.title: section for section in old_sections},
+        'new_section_map': {section.title: section for section in new_sections}
+    }
 
-def get_section_identifier(section: str) -> str:
-    """Create a consistent identifier for each section"""
-    first_line = section.split('\n')[0].strip()
-    normalized = re.sub(r'[^\w\s]', '', first_line.lower())
-    normalized = re.sub(r'\s+', ' ', normalized).strip()
-    return normalized[:100]
+def section_result(comparison: Dict) -> SectionComparisonResult:
+    """The API model of a compare_sections result"""
+    return SectionComparisonResult(
+        added_sections=[section.to_model() for section in comparison['added_sections']],
+        deleted_sections=[section.to_model() for section in comparison['deleted_sections']],
+        moved_sections=[
+            SectionMove(title=title, old_position=old_position, new_position=new_position)
+            for title, old_position, new_position in comparison['moved_sections']
+        ],
+        renamed_sections=[
+            SectionRename(old_title=old_title, new_title=new_title, similarity=similarity, method=method)
+            for old_title, new_title, similarity, method in comparison['renamed_sections']
+        ]
+    )
 
-def compare_sections(old_text: str, new_text: str) -> Dict:
-    """Identify added and deleted sections between documents"""
-    old_sections = preprocess_text(old_text)
-    new_sections = preprocess_text(new_text)
+def _rebind_documents(comparison: Dict, old_text: Optional[str], new_text: Optional[str]) -> Dict:
+    for section_map, text in ((comparison['old_section_map'], old_text), (comparison['new_section_map'], new_text)):
+        for section in section_map.values():
+            section.document = text
+    return comparison
+
+def compare_section_offsets(old_text: str, new_text: str) -> Dict:
+    """
+    compare_sections for a worker process: the records come back without their documents,
+    so only offsets, fingerprints and titles are pickled. share_documents restores them.
+    """
+    return _rebind_documents(compare_sections(old_text, new_text), None, None)
+
+def share_documents(comparison: Dict, old_text: str, new_text: str) -> Dict:
+    """Point the records of a compare_section_offsets result at the caller's document strings"""
+    return _rebind_documents(comparison, old_text, new_text)
+
+class SectionAlignment(NamedTuple):
+    """Index-based alignment of two section sequences"""
+    matches: List[Tuple[int, int]]  # (old_index, new_index), ordered by new_index
+    moved: List[Tuple[int, int]]  # matches outside the longest in-order run
+    renamed: List[Tuple[int, int, float, str]]  # matches with different identifiers: similarity, method
+    added: List[int]
+    deleted: List[int]
+
+def _longest_increasing(values: Sequence[int]) -> Set[int]:
+    """Positions of one longest strictly increasing subsequence, in O(n log n)"""
+    tails: List[int] = []
+    tail_positions: List[int] = []
+    previous: List[Optional[int]] = [None] * len(values)
+    for position, value in enumerate(values):
+        k = bisect.bisect_left(tails, value)
+        if k == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[k] = value
+            tail_positions[k] = position
+        previous[position] = tail_positions[k - 1] if k else None
     
-    old_map = {get_section_identifier(s): s for s in old_sections}
-    new_map = {get_section_identifier(s): s for s in new_sections}
+    in_order = set()
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        in_order.add(position)
+        position = previous[position]
+    return in_order
+
+def _similarity_texts(contents: Iterable[str]) -> List[str]:
+    """
+    Normalized prefixes that section similarity is computed on. Normalized here rather than
+    through normalize_paragraph, so section text never fills the paragraph cache
+    """
+    return [normalize_text(content[:SECTION_SIMILARITY_CHARS]) for content in contents]
+
+def _pair_repeated(old_group: List[int], new_group: List[int],
+                   old_text: Dict[int, str], new_text: Dict[int, str]) -> List[Tuple[int, int]]:
+    """Pair sections sharing an identifier: most similar first, then the rest in order"""
+    if len(old_group) == 1 and len(new_group) == 1:
+        return [(old_group[0], new_group[0])]
     
-    old_keys = set(old_map.keys())
-    new_keys = set(new_map.keys())
+    pairs = [
+        (old_group[a], new_group[b])
+        for a, b, _ in match_paragraphs(
+            [old_text[i] for i in old_group],
+            [new_text[j] for j in new_group],
+            min_ratio=0.0,
+            normalized=True
+        )
+    ]
+    paired_old = {i for i, _ in pairs}
+    paired_new = {j for _, j in pairs}
+    pairs.extend(zip(
+        [i for i in old_group if i not in paired_old],
+        [j for j in new_group if j not in paired_new]
+    ))
+    return pairs
+
+def align_sections(
+    old_identifiers: Sequence[str],
+    old_fingerprints: Sequence[Hashable],
+    new_identifiers: Sequence[str],
+    new_fingerprints: Sequence[Hashable],
+    old_contents: Callable[[List[int]], Iterable[str]],
+    new_contents: Callable[[List[int]], Iterable[str]]
+) -> SectionAlignment:
+    """
+    Align two ordered section lists without collapsing repeated identifiers:
+    1. sections with identical fingerprints are paired in order (unchanged, possibly moved);
+    2. remaining sections sharing an identifier are paired by content similarity;
+    3. remaining sections whose content is at least SECTION_RENAME_MIN_SIMILARITY similar
+       are paired as renamed;
+    4. with SEMANTIC_MATCHING on, sections still unpaired are paired by nearest-neighbour
+       vector similarity, so rewritten and renumbered sections become modifications
+       rather than a delete plus an add.
+    Matches outside the longest run that keeps both orders are reported as moved.
+    Contents are only requested for sections left unpaired by step 1, and only their
+    similarity prefixes are kept (full texts are requested again for semantic matching);
+    similarity uses the shared-word index for large groups, so the cost stays near-linear.
+    """
+    matches: List[Tuple[int, int]] = []
+    # Indices stored last-first so pop() hands them out in document order; a deque per
+    # fingerprint costs several times a short list on documents with thousands of sections
+    old_by_fingerprint = defaultdict(list)
+    for i in range(len(old_fingerprints) - 1, -1, -1):
+        old_by_fingerprint[old_fingerprints[i]].append(i)
     
-    added = [SectionChange(title=k, content=new_map[k]) for k in new_keys - old_keys]
-    deleted = [SectionChange(title=k, content=old_map[k]) for k in old_keys - new_keys]
+    new_unmatched = []
+    for j, fingerprint in enumerate(new_fingerprints):
+        candidates = old_by_fingerprint.get(fingerprint)
+        if candidates:
+            matches.append((candidates.pop(), j))
+        else:
+            new_unmatched.append(j)
+    old_unmatched = sorted(i for candidates in old_by_fingerprint.values() for i in candidates)
     
-    return {
-        'added_sections': added,
-        'deleted_sections': deleted,
-        'common_sections': list(old_keys & new_keys),
-        'old_section_map': old_map,
-        'new_section_map': new_map
-    }
+    old_text = dict(zip(old_unmatched, _similarity_texts(old_contents(old_unmatched)))) if old_unmatched else {}
+    new_text = dict(zip(new_unmatched, _similarity_texts(new_contents(new_unmatched)))) if new_unmatched else {}
+    
+    old_groups, new_groups = defaultdict(list), defaultdict(list)
+    for i in old_unmatched:
+        old_groups[old_identifiers[i]].append(i)
+    for j in new_unmatched:
+        new_groups[new_identifiers[j]].append(j)
+    
+    paired_old, paired_new = set(), set()
+    for identifier, new_group in new_groups.items():
+        if identifier in old_groups:
+            for i, j in _pair_repeated(old_groups[identifier], new_group, old_text, new_text):
+                matches.append((i, j))
+                paired_old.add(i)
+                paired_new.add(j)
+    
+    old_rest = [i for i in old_unmatched if i not in paired_old]
+    new_rest = [j for j in new_unmatched if j not in paired_new]
+    renamed = []
+    if old_rest and new_rest:
+        for a, b, ratio in match_paragraphs(
+            [old_text[i] for i in old_rest],
+            [new_text[j] for j in new_rest],
+            min_ratio=SECTION_RENAME_MIN_SIMILARITY,
+            normalized=True
+        ):
+            matches.append((old_rest[a], new_rest[b]))
+            renamed.append((old_rest[a], new_rest[b], ratio, "text"))
+            paired_old.add(old_rest[a])
+            paired_new.add(new_rest[b])
+        
+        old_rest = [i for i in old_rest if i not in paired_old]
+        new_rest = [j for j in new_rest if j not in paired_new]
+        semantic_pairs = match_semantic(
+            list(old_contents(old_rest)), list(new_contents(new_rest))
+        ) if semantic_backend is not None and old_rest and new_rest else []
+        for a, b, similarity in semantic_pairs:
+            matches.append((old_rest[a], new_rest[b]))
+            renamed.append((old_rest[a], new_rest[b], similarity, "semantic"))
+            paired_old.add(old_rest[a])
+            paired_new.add(new_rest[b])
+    
+    matches.sort(key=lambda match: match[1])
+    in_order = _longest_increasing([i for i, _ in matches])
+    
+    return SectionAlignment(
+        matches=matches,
+        moved=[match for position, match in enumerate(matches) if position not in in_order],
+        renamed=sorted(renamed, key=lambda rename: rename[1]),
+        added=[j for j in new_unmatched if j not in paired_new],
+        deleted=[i for i in old_unmatched if i not in paired_old]
+    )
+
+# Replace blocks with more old x new pairs than this use the token index to pick candidates
+EXHAUSTIVE_MATCH_LIMIT = 2500
+CANDIDATES_PER_PARAGRAPH = 8
 
-def split_into_paragraphs(text: str) -> List[str]:
-    """Improved paragraph splitting that handles various formats"""
-    paragraphs = re.split(r'\n\s*\n|\n\s*[\-\*•]\s+', text.strip())
-    return [p.strip() for p in paragraphs if p.strip() and len(p.strip()) > 10]
+def _indexed_candidates(old_normalized: List[str], new_normalized: List[str]) -> List[List[int]]:
+    """
+    For each new paragraph, the old paragraphs sharing the most distinctive words.
+    Words occurring in more than ~sqrt(n) old paragraphs are ignored so lookups stay near-linear.
+    """
+    postings = defaultdict(list)
+    for i, text in enumerate(old_normalized):
+        for token in dict.fromkeys(word_tokens(text)):
+            postings[token].append(i)
+    
+    max_frequency = max(CANDIDATES_PER_PARAGRAPH, int(math.sqrt(len(old_normalized))))
+    candidates = []
+    for text in new_normalized:
+        shared = Counter()
+        for token in dict.fromkeys(word_tokens(text)):
+            indices = postings.get(token)
+            if indices and len(indices) <= max_frequency:
+                shared.update(indices)
+        candidates.append([i for i, _ in shared.most_common(CANDIDATES_PER_PARAGRAPH)])
+    return candidates
 
-def compare_paragraphs(old_para: str, new_para: str) -> Tuple[bool, float]:
-    """Compare paragraphs with improved similarity detection"""
-    old_normalized = re.sub(r'\s+', ' ', old_para.strip().lower())
-    new_normalized = re.sub(r'\s+', ' ', new_para.strip().lower())
+def match_paragraphs(
+    old_paras: List[str],
+    new_paras: List[str],
+    min_ratio: Optional[float] = None,
+    normalized: bool = False
+) -> List[Tuple[int, int, float]]:
+    """
+    One-to-one alignment of old and new paragraphs by similarity.
+    Candidate pairs are pruned by length bounds and the similarity backend's score cutoff
+    before the full ratio is computed, then assigned greedily best-first.
+    Large blocks only consider the top candidates from a shared-word index.
+    Returns (old_index, new_index, ratio) tuples for pairs with ratio above min_ratio,
+    which defaults to the backend's lower modified threshold.
+    normalized=True skips normalize_paragraph for inputs already normalized by the caller.
+    """
+    if min_ratio is None:
+        min_ratio = similarity_backend.min_modified
+    
+    old_normalized = old_paras if normalized else [normalize_paragraph(p) for p in old_paras]
+    new_normalized = new_paras if normalized else [normalize_paragraph(p) for p in new_paras]
+    
+    if len(old_normalized) * len(new_normalized) > EXHAUSTIVE_MATCH_LIMIT:
+        indexed = _indexed_candidates(old_normalized, new_normalized)
+    else:
+        indexed = None
     
-    if old_normalized == new_normalized:
-        return (False, 1.0)
+    # ratio <= 2 * shorter / (shorter + longer), so pairs outside this length ratio can't reach min_ratio
+    length_bound = min_ratio / (2 - min_ratio)
     
-    matcher = difflib.SequenceMatcher(None, old_normalized, new_normalized)
-    ratio = matcher.ratio()
+    candidates = []
+    for j, new_text in enumerate(new_normalized):
+        old_indices = indexed[j] if indexed is not None else range(len(old_normalized))
+        for i in old_indices:
+            old_text = old_normalized[i]
+            if old_text == new_text:
+                candidates.append((1.0, i, j))
+                continue
+            shorter, longer = sorted((len(old_text), len(new_text)))
+            if shorter <= longer * length_bound:
+                continue
+            ratio = similarity_backend.ratio(old_text, new_text, score_cutoff=min_ratio)
+            if ratio > min_ratio:
+                candidates.append((ratio, i, j))
     
-    return (0.3 < ratio < 0.9, ratio)
+    # Best pairs first; prefer pairs closer in position on ties
+    candidates.sort(key=lambda c: (-c[0], abs(c[1] - c[2])))
+    used_old, used_new = set(), set()
+    matches = []
+    for ratio, i, j in candidates:
+        if i in used_old or j in used_new:
+            continue
+        used_old.add(i)
+        used_new.add(j)
+        matches.append((i, j, ratio))
+    
+    return sorted(matches)
 
 def analyze_paragraph_changes(old_content: str, new_content: str) -> ParagraphComparisonResult:
     """Detailed paragraph-level comparison with improved change detection"""
@@ -101,21 +436,53 @@ def analyze_paragraph_changes(old_content: str, new_content: str) -> ParagraphCo
         elif tag == 'insert':
             added.extend([ParagraphChange(new_paragraph=p) for p in new_paras[j1:j2]])
         elif tag == 'replace':
-            for i in range(i1, i2):
-                for j in range(j1, j2):
-                    is_modified, ratio = compare_paragraphs(old_paras[i], new_paras[j])
-                    if is_modified:
-                        modified.append(ParagraphChange(
-                            old_paragraph=old_paras[i],
-                            new_paragraph=new_paras[j],
-                            similarity=ratio
-                        ))
-                    else:
-                        deleted.append(ParagraphChange(old_paragraph=old_paras[i]))
-                        added.append(ParagraphChange(new_paragraph=new_paras[j]))
+            old_block = old_paras[i1:i2]
+            new_block = new_paras[j1:j2]
+            matched_old, matched_new = set(), set()
+            
+            for i, j, ratio in match_paragraphs(old_block, new_block):
+                matched_old.add(i)
+                matched_new.add(j)
+                # Only pairs that normalize to the same text are unchanged; a small edit
+                # such as "shall" -> "may" in a long paragraph still scores near 1.0
+                if normalize_paragraph(old_block[i]) != normalize_paragraph(new_block[j]):
+                    modified.append(ParagraphChange(
+                        old_paragraph=old_block[i],
+                        new_paragraph=new_block[j],
+                        similarity=ratio,
+                        diff=word_diff(old_block[i], new_block[j])
+                    ))
+            
+            deleted.extend([ParagraphChange(old_paragraph=p) for i, p in enumerate(old_block) if i not in matched_old])
+            added.extend([ParagraphChange(new_paragraph=p) for j, p in enumerate(new_block) if j not in matched_new])
     
     return ParagraphComparisonResult(
         added_paragraphs=added,
         deleted_paragraphs=deleted,
         modified_paragraphs=modified
-    )
\ No newline at end of file
+    )
+
+def changed_section_records(comparison: Dict) -> List[Tuple[str, SectionRecord, SectionRecord]]:
+    """(section_id, old_record, new_record) for common sections whose text differs"""
+    old_map = comparison['old_section_map']
+    new_map = comparison['new_section_map']
+    changed = []
+    for old_key, new_key in comparison['matched_sections']:
+        old_section, new_section = old_map[old_key], new_map[new_key]
+        if old_section.fingerprint != new_section.fingerprint:
+            changed.append((new_key, old_section, new_section))
+    return changed
+
+def get_changed_sections(comparison: Dict) -> List[Tuple[str, str, str]]:
+    """(section_id, old_content, new_content) for common sections whose text differs"""
+    return [
+        (section_id, old_section.content, new_section.content)
+        for section_id, old_section, new_section in changed_section_records(comparison)
+    ]
+
+def analyze_section_paragraphs(changed_sections: List[Tuple[str, str, str]]) -> Dict[str, ParagraphComparisonResult]:
+    """Paragraph analysis for each (section_id, old_content, new_content) triple"""
+    return {
+        section_id: analyze_paragraph_changes(old_content, new_content)
+        for section_id, old_content, new_content in changed_sections
+    }
@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from config import DIFF_PROCESS_WORKERS, IO_THREAD_WORKERS, LLM_CONCURRENCY
+
+class TrackedExecutor:
+    """Wraps an executor to count queued/running/completed tasks for metrics"""
+
+    def __init__(self, name: str, executor: Executor, workers: int):
+        self.name = name
+        self.executor = executor
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            self.pending += 1
+        future = self.executor.submit(func, *args, **kwargs)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future: Future) -> None:
+        with self._lock:
+            self.pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "completed": self.completed,
+                "failed": self.failed
+            }
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+_process_pool: Optional[TrackedExecutor] = None
+_thread_pool: Optional[TrackedExecutor] = None
+_llm_pool: Optional[TrackedExecutor] = None
+_pools_lock = threading.Lock()
+
+def get_thread_pool() -> TrackedExecutor:
+    """Thread pool for blocking I/O such as LLM requests"""
+    global _thread_pool
+    with _pools_lock:
+        if _thread_pool is None:
+            _thread_pool = TrackedExecutor(
+                "io_threads",
+                ThreadPoolExecutor(max_workers=IO_THREAD_WORKERS, thread_name_prefix="io"),
+                IO_THREAD_WORKERS
+            )
+        return _thread_pool
+
+def get_llm_pool() -> TrackedExecutor:
+    """
+    Thread pool that runs every model call, so LLM_CONCURRENCY bounds the requests
+    sent to Ollama by the whole process rather than by each request
+    """
+    global _llm_pool
+    with _pools_lock:
+        if _llm_pool is None:
+            _llm_pool = TrackedExecutor(
+                "llm_threads",
+                ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="llm"),
+                LLM_CONCURRENCY
+            )
+        return _llm_pool
+
+def get_process_pool() -> Optional[TrackedExecutor]:
+    """Process pool for CPU-bound diffing, None when DIFF_PROCESS_WORKERS is 0"""
+    global _process_pool
+    if DIFF_PROCESS_WORKERS <= 0:
+        return None
+    with _pools_lock:
+        if _process_pool is None:
+            _process_pool = TrackedExecutor(
+                "diff_processes",
+                ProcessPoolExecutor(max_workers=DIFF_PROCESS_WORKERS),
+                DIFF_PROCESS_WORKERS
+            )
+        return _process_pool
+
+async def _run_in(pool: TrackedExecutor, func: Callable, *args, **kwargs) -> Any:
+    return await asyncio.wrap_future(pool.submit(functools.partial(func, *args, **kwargs)))
+
+async def run_cpu_bound(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a CPU-bound function without blocking the event loop.
+    func and its arguments must be picklable; falls back to the thread pool when
+    the process pool is disabled.
+    """
+    pool = get_process_pool() or get_thread_pool()
+    return await _run_in(pool, func, *args, **kwargs)
+
+async def run_blocking_io(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking I/O function on the shared thread pool, in a copy of the caller's context"""
+    context = contextvars.copy_context()
+    return await _run_in(get_thread_pool(), context.run, func, *args, **kwargs)
+
+async def run_llm(func: Callable, *args, **kwargs) -> Any:
+    """Run a model call on the shared LLM pool, in a copy of the caller's context"""
+    context = contextvars.copy_context()
+    return await _run_in(get_llm_pool(), context.run, func, *args, **kwargs)
+
+def cpu_workers() -> int:
+    """Number of workers available for CPU-bound tasks"""
+    pool = get_process_pool() or get_thread_pool()
+    return pool.workers
+
+def balance_chunks(items: Sequence, n_chunks: int, size: Callable[[Any], int]) -> List[List]:
+    """
+    Split items into at most n_chunks lists of similar total size, largest items first
+    (longest-processing-time scheduling). Chunks are returned heaviest first.
+    """
+    n_chunks = max(1, min(n_chunks, len(items)))
+    heap = [(0, index, []) for index in range(n_chunks)]
+    for item in sorted(items, key=size, reverse=True):
+        total, index, chunk = heapq.heappop(heap)
+        chunk.append(item)
+        heapq.heappush(heap, (total + size(item), index, chunk))
+    return [chunk for _, _, chunk in sorted(heap, key=lambda entry: -entry[0]) if chunk]
+
+def pool_stats() -> Dict[str, Any]:
+    return {
+        pool.name: pool.stats()
+        for pool in (_process_pool, _thread_pool, _llm_pool)
+        if pool is not None
+    }
+
+def shutdown_pools() -> None:
+    global _process_pool, _thread_pool, _llm_pool
+    with _pools_lock:
+        for pool in (_process_pool, _thread_pool, _llm_pool):
+            if pool is not None:
+                pool.shutdown()
+        _process_pool = None
+        _thread_pool = None
+        _llm_pool = None
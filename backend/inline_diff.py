@@ -0,0 +1,79 @@
+import difflib
+from typing import Dict, List, Tuple, Union
+
+from tokenizer import diff_tokens
+
+# ("=", n) keeps the next n characters of the old text, ("-", text) deletes text from it
+# and ("+", text) inserts text; the new text is the old one with the spans applied in order
+DiffSpan = Tuple[str, Union[int, str]]
+
+def _changes(old_tokens: List[str], new_tokens: List[str]) -> List[List[str]]:
+    """[op, text] segments of a token-level diff, matching tokens by interned id"""
+    ids: Dict[str, int] = {}
+    old_ids = [ids.setdefault(token, len(ids)) for token in old_tokens]
+    new_ids = [ids.setdefault(token, len(ids)) for token in new_tokens]
+
+    # Most edits are local, so the shared prefix and suffix are trimmed before matching
+    limit = min(len(old_ids), len(new_ids))
+    prefix = 0
+    while prefix < limit and old_ids[prefix] == new_ids[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_ids[-1 - suffix] == new_ids[-1 - suffix]:
+        suffix += 1
+
+    old_end, new_end = len(old_ids) - suffix, len(new_ids) - suffix
+    segments = [["=", "".join(old_tokens[:prefix])]]
+    matcher = difflib.SequenceMatcher(None, old_ids[prefix:old_end], new_ids[prefix:new_end], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        old_text = "".join(old_tokens[prefix + i1:prefix + i2])
+        new_text = "".join(new_tokens[prefix + j1:prefix + j2])
+        if tag == "equal":
+            segments.append(["=", old_text])
+            continue
+        if old_text:
+            segments.append(["-", old_text])
+        if new_text:
+            segments.append(["+", new_text])
+    segments.append(["=", "".join(old_tokens[old_end:])])
+    return [segment for segment in segments if segment[1]]
+
+def word_diff(old: str, new: str) -> List[DiffSpan]:
+    """
+    Compact word-level diff of two paragraphs as DiffSpan opcodes. An unchanged stretch
+    between two changes is folded into them when it is no longer than the changes on
+    either side, so a rewritten phrase reads as one deletion and one insertion rather
+    than alternating single words.
+    """
+    # Unchanged text as str, changes as [deleted, inserted]
+    groups: List[Union[str, List[str]]] = []
+    for op, text in _changes(diff_tokens(old), diff_tokens(new)):
+        if op == "=":
+            groups.append(text)
+            continue
+        if not groups or isinstance(groups[-1], str):
+            groups.append(["", ""])
+        groups[-1][0 if op == "-" else 1] += text
+
+    position = 1
+    while position < len(groups) - 1:
+        before, equal, after = groups[position - 1:position + 2]
+        if (isinstance(equal, str) and isinstance(before, list) and isinstance(after, list)
+                and len(equal) <= max(map(len, before)) and len(equal) <= max(map(len, after))):
+            groups[position - 1:position + 2] = [[before[0] + equal + after[0], before[1] + equal + after[1]]]
+            # The merged change may now absorb the equality before it
+            position = max(position - 2, 1)
+        else:
+            position += 1
+
+    spans: List[DiffSpan] = []
+    for group in groups:
+        if isinstance(group, str):
+            spans.append(("=", len(group)))
+            continue
+        deleted, inserted = group
+        if deleted:
+            spans.append(("-", deleted))
+        if inserted:
+            spans.append(("+", inserted))
+    return spans
@@ -0,0 +1,169 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import JOB_WORKERS, JOB_RESULT_TTL, JOB_MAX_JOBS
+from pipeline import analyses_as_completed, prepare_added_ai, prepare_modified_ai
+from batch import BatchPair, run_batch
+
+Preparer = Callable[[str, str, bool], Awaitable[Tuple[List, Callable[[Any], Dict]]]]
+
+def _added_result(results: List[Dict]) -> List[Dict]:
+    return results
+
+def _modified_result(results: List[Dict]) -> Dict[str, Dict]:
+    return {result["section_id"]: result for result in results}
+
+# Job kind -> (items and per-item analysis, final result shape matching the blocking endpoint)
+JOB_KINDS: Dict[str, Tuple[Preparer, Callable[[List[Dict]], Any]]] = {
+    "added_ai": (prepare_added_ai, _added_result),
+    "modified_ai": (prepare_modified_ai, _modified_result),
+}
+
+class TooManyJobsError(Exception):
+    """Raised when every retained job is still queued or running"""
+
+class Job:
+    """State of one background analysis or batch comparison"""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.done = 0
+        self.total: Optional[int] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def summary(self, include_result: bool = False) -> Dict[str, Any]:
+        summary = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total},
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error
+        }
+        if include_result and self.status == "done":
+            summary["result"] = self.result
+        return summary
+
+class JobManager:
+    """
+    In-process queue of AI analyses and batch comparisons run as asyncio tasks, at most
+    `workers` at a time. Finished jobs are kept for `ttl` seconds; at most `max_jobs` jobs are retained.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, ttl: float = JOB_RESULT_TTL, max_jobs: int = JOB_MAX_JOBS):
+        self.workers = workers
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _expire(self) -> None:
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished_at > self.ttl:
+                del self._jobs[job_id]
+        # Over the limit, drop the oldest finished jobs first
+        for job_id, job in list(self._jobs.items()):
+            if len(self._jobs) < self.max_jobs:
+                break
+            if job.finished:
+                del self._jobs[job_id]
+
+    def submit(self, kind: str, old_text: str, new_text: str, bypass_cache: bool) -> Job:
+        """Queue an analysis of kind "added_ai" or "modified_ai"; must be called on the event loop"""
+        if kind not in JOB_KINDS:
+            raise KeyError(f"Unknown job kind '{kind}'")
+        return self._start(kind, lambda job: self._analyze(job, old_text, new_text, bypass_cache))
+
+    def submit_batch(self, pairs: List[BatchPair], **options) -> Job:
+        """Queue a run_batch comparison; progress counts comparisons and LLM analyses"""
+        def work(job: Job) -> Awaitable[Dict]:
+            def progress(done: int, total: int) -> None:
+                job.done, job.total = done, total
+            return run_batch(pairs, progress=progress, **options)
+
+        return self._start("batch", work)
+
+    def _start(self, kind: str, work: Callable[[Job], Awaitable[Any]]) -> Job:
+        self._expire()
+        if len(self._jobs) >= self.max_jobs:
+            raise TooManyJobsError(f"{len(self._jobs)} jobs are already queued or running")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        job = Job(kind)
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, work))
+        return job
+
+    async def _run(self, job: Job, work: Callable[[Job], Awaitable[Any]]) -> None:
+        try:
+            async with self._slots:
+                job.status = "running"
+                job.result = await work(job)
+                job.status = "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+    async def _analyze(self, job: Job, old_text: str, new_text: str, bypass_cache: bool) -> Any:
+        prepare, finalize = JOB_KINDS[job.kind]
+        items, analyze = await prepare(old_text, new_text, bypass_cache)
+        job.total = len(items)
+        results: List[Optional[Dict]] = [None] * len(items)
+        async for index, result in analyses_as_completed(items, analyze):
+            results[index] = result
+            job.done += 1
+        return finalize(results)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a queued or running job. LLM requests already in flight finish in the
+        background, but no further sections are started.
+        """
+        job = self.get(job_id)
+        if job is not None and not job.finished and job.task is not None:
+            job.task.cancel()
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        return job
+
+    def list(self) -> List[Dict[str, Any]]:
+        self._expire()
+        return [job.summary() for job in self._jobs.values()]
+
+    def stats(self) -> Dict[str, int]:
+        counts = {status: 0 for status in ("queued", "running", "done", "failed", "cancelled")}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {"workers": self.workers, **counts}
+
+    def shutdown(self) -> None:
+        for job in self._jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+
+job_manager = JobManager()
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, LLM_CACHE_TOUCH_INTERVAL
+
+class LLMResponseCache:
+    """
+    On-disk cache of parsed LLM responses backed by SQLite.
+    Entries are evicted least-recently-used first once the stored payloads exceed max_bytes.
+    The payload total is counted in memory from startup on, and hits refresh an entry's
+    last access at most every touch_interval seconds, so neither needs a table scan or a write.
+    """
+
+    # Least-recently-used entries read per eviction query
+    EVICT_BATCH = 256
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES,
+                 touch_interval: float = LLM_CACHE_TOUCH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, *content: str) -> str:
+        """Key on model name, prompt-template version and a hash of the section content"""
+        content_hash = hashlib.sha256("\x00".join(content).encode()).hexdigest()
+        return f"{model}:{prompt_version}:{content_hash}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, last_access FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            now = time.time()
+            if now - row[1] >= self.touch_interval:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        payload = json.dumps(value)
+        with self._lock:
+            replaced = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload), time.time())
+            )
+            self._total += len(payload) - (replaced[0] if replaced else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes:
+            oldest = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT ?", (self.EVICT_BATCH,)
+            ).fetchall()
+            if not oldest:
+                self._total = 0
+                return
+            for key, size in oldest:
+                if self._total <= self.max_bytes:
+                    return
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total -= size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._total = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            size = self._total
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+# Shared cache used by llm_utility
+llm_cache = LLMResponseCache()
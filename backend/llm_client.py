@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    OLLAMA_POOL_SIZE,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_READ_TIMEOUT,
+    OLLAMA_MAX_RETRIES,
+    OLLAMA_RETRY_BACKOFF,
+    OLLAMA_CIRCUIT_FAILURES,
+    OLLAMA_CIRCUIT_RESET,
+)
+
+# Status codes worth retrying; other HTTP errors are returned to the caller immediately
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Transport failures worth retrying, including a streamed body that stalls or breaks off
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the model while the circuit breaker is open"""
+
+class OllamaClient:
+    """
+    Shared HTTP client for the Ollama API with a pooled keep-alive session,
+    connect/read timeouts, bounded retries with exponential backoff and a circuit breaker.
+    After failure_threshold consecutive failed calls the circuit opens and calls fail fast
+    for reset_timeout seconds, then a single trial call decides whether it closes again.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        pool_size: int = OLLAMA_POOL_SIZE,
+        connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+        read_timeout: float = OLLAMA_READ_TIMEOUT,
+        max_retries: int = OLLAMA_MAX_RETRIES,
+        retry_backoff: float = OLLAMA_RETRY_BACKOFF,
+        failure_threshold: int = OLLAMA_CIRCUIT_FAILURES,
+        reset_timeout: float = OLLAMA_CIRCUIT_RESET
+    ):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def _before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(f"LLM circuit open after {self._consecutive_failures} consecutive failures")
+            # Half-open: let one trial call through
+            self._trial_in_flight = True
+
+    def _record(self, success: bool, latency: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self._trial_in_flight = False
+            if success:
+                self._consecutive_failures = 0
+                self._opened_at = None
+            else:
+                self.errors += 1
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+
+    def _backoff(self, attempt: int) -> None:
+        with self._lock:
+            self.retries += 1
+        delay = self.retry_backoff * (2 ** attempt)
+        time.sleep(delay + random.uniform(0, delay / 2))
+
+    def post(self, payload: Dict[str, Any], read: Optional[Callable[[requests.Response], Any]] = None) -> Any:
+        """
+        POST a payload to the Ollama endpoint, retrying transient failures, and return the response.
+        With read, the response is streamed and read(response) is returned instead; reading the
+        body is part of the call, so a stream that times out or breaks off midway is retried and
+        counted as a failure, and latency covers the whole body.
+        """
+        self._before_call()
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout, stream=read is not None)
+                if response.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                    response.close()
+                    self._backoff(attempt)
+                    attempt += 1
+                    continue
+                response.raise_for_status()
+                result = read(response) if read is not None else response
+            except RETRYABLE_ERRORS:
+                if attempt < self.max_retries:
+                    self._backoff(attempt)
+                    attempt += 1
+                    continue
+                self._record(False, time.perf_counter() - start)
+                raise
+            except Exception:
+                self._record(False, time.perf_counter() - start)
+                raise
+            self._record(True, time.perf_counter() - start)
+            return result
+
+    @property
+    def circuit_state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.circuit_state
+        with self._lock:
+            return {
+                "url": self.url,
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "rejected": self.rejected,
+                "latency_avg": self.latency_total / self.calls if self.calls else 0.0,
+                "latency_max": self.latency_max,
+                "circuit": state
+            }
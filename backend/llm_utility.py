@@ -1,13 +1,148 @@
-import requests
+import contextvars
 import json
-from typing import List, Dict
+import os
+import threading
+from typing import Any, List, Dict, Callable, Iterable, Optional
 from difference_utility import SectionChange
+from config import (
+    LLM_CACHE_BYPASS,
+    LLM_BATCH_MODE,
+    LLM_BATCH_TOKEN_BUDGET,
+    LLM_BATCH_MAX_SECTIONS,
+    LLM_STREAM,
+    LLM_MAX_TOKENS,
+)
+from executors import get_llm_pool
+from llm_cache import llm_cache
+from llm_client import OllamaClient
+from metrics import span
 
 # Configuration
-OLLAMA_API_URL = "http://localhost:11434/api/generate"
-MODEL_NAME = "tinyllama"  # Change to your preferred model
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/generate")
+MODEL_NAME = os.getenv("OLLAMA_MODEL", "tinyllama")  # Change to your preferred model
 
-def analyze_changes_with_llm(section: SectionChange) -> Dict:
+# Pooled keep-alive client shared by every analysis
+ollama_client = OllamaClient(OLLAMA_API_URL)
+
+# Bump when a prompt template changes so cached responses are not reused
+ADDED_PROMPT_VERSION = "added-v1"
+MODIFIED_PROMPT_VERSION = "modified-v1"
+ADDED_BATCH_PROMPT_VERSION = "added-batch-v1"
+MODIFIED_BATCH_PROMPT_VERSION = "modified-batch-v1"
+
+# Rough prompt overhead of a batch template, in tokens
+BATCH_PROMPT_OVERHEAD = 250
+
+class JsonObjectScanner:
+    """
+    Incremental scanner over streamed model output that finds where the first top-level
+    JSON object ends, tracking nesting depth, strings and escapes across chunk boundaries
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start: Optional[int] = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Add a chunk; returns the complete object's text once its closing brace arrives"""
+        offset = len(self.text)
+        self.text += chunk
+        for position, char in enumerate(chunk, offset):
+            if self.start is None:
+                # Anything before the opening bracket is ignored
+                if char in "{[":
+                    self.start = position
+                    self.depth = 1
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return self.text[self.start:position + 1]
+        return None
+
+def _read_streamed(response) -> str:
+    """
+    Read NDJSON generation chunks until a complete JSON object has arrived, then close the
+    connection so Ollama stops generating, instead of waiting for trailing output.
+    Returns the object's text, or all generated text if none completed.
+    """
+    scanner = JsonObjectScanner()
+    with span("llm_generate") as attributes:
+        chunks = 0
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                chunks += 1
+                complete = scanner.feed(data.get("response", ""))
+                if complete is not None:
+                    attributes["early_stops"] = 0 if data.get("done") else 1
+                    return complete
+                if data.get("done"):
+                    break
+        finally:
+            attributes["chunks"] = chunks
+            response.close()
+    return scanner.text
+
+def query_llm(prompt: str, max_tokens: int = LLM_MAX_TOKENS, stream: bool = LLM_STREAM) -> Dict:
+    """
+    Send a prompt to Ollama and parse the JSON object it returns.
+    Generation is capped at max_tokens (num_predict); streamed responses are cut off as
+    soon as the first complete JSON object has been generated.
+    """
+    payload = {
+        "model": MODEL_NAME,
+        "prompt": prompt,
+        "format": "json",
+        "stream": stream
+    }
+    if max_tokens > 0:
+        payload["options"] = {"num_predict": max_tokens}
+    if stream:
+        return json.loads(ollama_client.post(payload, read=_read_streamed))
+    
+    response = ollama_client.post(payload)
+    # Ollama returns newline-delimited JSON
+    full_response = ""
+    for line in response.text.splitlines():
+        data = json.loads(line)
+        full_response += data.get("response", "")
+    
+    return json.loads(full_response)
+
+def cached_query(cache_key: str, prompt: str, bypass_cache: bool = LLM_CACHE_BYPASS) -> Dict:
+    """
+    query_llm backed by the persistent response cache.
+    bypass_cache skips the lookup but still stores the fresh response.
+    """
+    with span("llm_query") as attributes:
+        if not bypass_cache:
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                attributes["cache_hits"] = 1
+                return cached
+        
+        attributes["llm_calls"] = 1
+        result = query_llm(prompt)
+        llm_cache.set(cache_key, result)
+        return result
+
+def analyze_changes_with_llm(section: SectionChange, bypass_cache: bool = LLM_CACHE_BYPASS) -> Dict:
     
     prompt = f"""
     As a regulatory document expert, analyze the section below and return a JSON object with:
@@ -31,22 +166,9 @@ def analyze_changes_with_llm(section: SectionChange) -> Dict:
     """
     
     try:
-        payload = {
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "format": "json",
-            "stream": False
-        }
-        response = requests.post(OLLAMA_API_URL, json=payload)
-        response.raise_for_status()
-        
-        # Ollama returns newline-delimited JSON
-        full_response = ""
-        for line in response.text.splitlines():
-            data = json.loads(line)
-            full_response += data.get("response", "")
-        
-        return json.loads(full_response)
+        with span("analyze_added_section", sections=1):
+            cache_key = llm_cache.make_key(MODEL_NAME, ADDED_PROMPT_VERSION, section.title, section.content)
+            return cached_query(cache_key, prompt, bypass_cache)
     except Exception as e:
         print(f"Error querying LLM: {e}")
         return {
@@ -54,76 +176,281 @@ def analyze_changes_with_llm(section: SectionChange) -> Dict:
             "change_type": "Unknown"
         }
 
-def analyze_added_sections(added_sections: List[SectionChange]) -> List[Dict]:
+def analyze_modified_section(
+    section_id: str,
+    content: Dict[str, str],
+    bypass_cache: bool = LLM_CACHE_BYPASS
+) -> Dict:
+    """Analyze a single modified section, returning a fallback dict on failure"""
+    prompt = f"""
+    Analyze this regulatory document change and return JSON with:
+    - section_id: Original section identifier
+    - change_summary:  A one-sentence summary of the section's modification,output "INSIGNIFICANT" for cases you dont know answer to
+    - change_type: One of ["New Requirement", "Clarification", 
+                      "Stricter Requirement", "Looser Requirement", "Minor Edit"]
+    - change_impact: Low/Medium/High impact assessment
+
+    Section ID: {section_id}
+    OLD VERSION:
+    {content['old'][:400]}
+    NEW VERSION:
+    {content['new'][:400]}
+
+    Return ONLY valid JSON with no additional text or formatting:
+    {{
+        "section_id": "{section_id}",
+        "change_summary": "",
+        "change_type": "",
+        "change_impact": ""
+    }}
+    """
+    
+    try:
+        with span("analyze_modified_section", sections=1):
+            cache_key = llm_cache.make_key(
+                MODEL_NAME, MODIFIED_PROMPT_VERSION, section_id, content['old'][:400], content['new'][:400]
+            )
+            return cached_query(cache_key, prompt, bypass_cache)
+    except Exception as e:
+        print(f"Error analyzing section {section_id}: {e}")
+        return {
+            "section_id": section_id,
+            "change_summary": "Analysis failed",
+            "change_type": "Unknown",
+            "change_impact": "Unknown"
+        }
+
+def run_concurrently(func: Callable, items: Iterable, max_workers: Optional[int] = None) -> List:
+    """
+    Apply func to every item on the shared LLM pool, preserving input order.
+    The pool's LLM_CONCURRENCY workers bound model calls across all requests;
+    max_workers further limits how many of this call's items run at once.
+    """
+    items = list(items)
+    pool = get_llm_pool()
+    slots = threading.BoundedSemaphore(max_workers or pool.workers)
+
+    # Workers run in copies of the caller's context so metric spans keep the request's endpoint
+    context = contextvars.copy_context()
+    futures = []
+    for item in items:
+        slots.acquire()
+        future = pool.submit(context.copy().run, func, item)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+    return [future.result() for future in futures]
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+def pack_batches(items: List, cost: Callable[[Any], int], budget: int, max_items: int) -> List[List]:
+    """Greedily pack items, in order, into batches whose total cost stays within budget"""
+    batches, current, current_cost = [], [], 0
+    for item in items:
+        item_cost = cost(item)
+        if current and (current_cost + item_cost > budget or len(current) >= max_items):
+            batches.append(current)
+            current, current_cost = [], 0
+        current.append(item)
+        current_cost += item_cost
+    if current:
+        batches.append(current)
+    return batches
+
+def parse_batch_results(response: Any, count: int, required_fields: List[str]) -> Dict[int, Dict]:
     """
-    Public interface for analyzing added sections
+    Map a batched response {"results": [{"index": i, ...}, ...]} back to batch positions.
+    Entries that are missing, out of range or lack a required field are left out.
+    """
+    entries = response.get("results", []) if isinstance(response, dict) else response
+    if not isinstance(entries, list):
+        return {}
+    
+    parsed = {}
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get("index", position)
+        if not isinstance(index, int) or not 0 <= index < count or index in parsed:
+            continue
+        if all(isinstance(entry.get(field), str) for field in required_fields):
+            parsed[index] = {field: entry[field] for field in required_fields}
+    return parsed
+
+def build_added_batch_prompt(sections: List[SectionChange]) -> str:
+    listing = "\n\n".join(
+        f"    [{index}] Section Title: {section.title}\n    Section Content: {section.content}"
+        for index, section in enumerate(sections)
+    )
+    return f"""
+    As a regulatory document expert, analyze each numbered section below and return a JSON object
+    with a "results" array holding one object per section, in the same order, with:
+    - index: The section number shown in brackets
+    - change_summary: A one-sentence summary of the section's purpose or change,output "INSIGNIFICANT" for cases you dont know answer to
+    - change_type: One of "New Requirement", "Clarification of Existing Requirement", "Deletion of Requirement", or "Minor Edit" (use for formatting/typo changes only).
+
+    Number of sections: {len(sections)}
+
+{listing}
+
+    Rules:
+    - Use only the provided titles and contents, and analyze each section on its own.
+    - Make change_summary specific (e.g., "Sets new audit deadline" not "New requirement").
+    - If unclear, default change_type to "Clarification of Existing Requirement".
+    - Return only a valid JSON object, no extra text.
+
+    Return:
+    {{
+        "results": [
+            {{"index": 0, "change_summary": "", "change_type": ""}}
+        ]
+    }}
+    """
+
+def build_modified_batch_prompt(items: List) -> str:
+    listing = "\n\n".join(
+        f"    [{index}] Section ID: {section_id}\n    OLD VERSION:\n    {content['old'][:400]}\n"
+        f"    NEW VERSION:\n    {content['new'][:400]}"
+        for index, (section_id, content) in enumerate(items)
+    )
+    return f"""
+    Analyze each numbered regulatory document change below and return a JSON object with a
+    "results" array holding one object per change, in the same order, with:
+    - index: The change number shown in brackets
+    - section_id: Original section identifier
+    - change_summary:  A one-sentence summary of the section's modification,output "INSIGNIFICANT" for cases you dont know answer to
+    - change_type: One of ["New Requirement", "Clarification", 
+                      "Stricter Requirement", "Looser Requirement", "Minor Edit"]
+    - change_impact: Low/Medium/High impact assessment
+
+    Number of sections: {len(items)}
+
+{listing}
+
+    Return ONLY valid JSON with no additional text or formatting:
+    {{
+        "results": [
+            {{"index": 0, "section_id": "", "change_summary": "", "change_type": "", "change_impact": ""}}
+        ]
+    }}
+    """
+
+def _analyze_in_batches(
+    items: List,
+    analyze_single: Callable[[Any], Dict],
+    build_prompt: Callable[[List], str],
+    cache_key: Callable[[Any], str],
+    cost: Callable[[Any], int],
+    required_fields: List[str],
+    max_workers: Optional[int],
+    bypass_cache: bool
+) -> List[Dict]:
+    """
+    Pack items into multi-section prompts up to LLM_BATCH_TOKEN_BUDGET and map the
+    JSON array answers back per item. Items whose answer is missing or unparseable,
+    or that don't fit a batch on their own, fall back to analyze_single.
+    """
+    results: List[Optional[Dict]] = [None] * len(items)
+    if not bypass_cache:
+        with span("llm_batch_cache_lookup", sections=len(items)) as attributes:
+            for index, item in enumerate(items):
+                results[index] = llm_cache.get(cache_key(item))
+            attributes["cache_hits"] = sum(1 for result in results if result is not None)
+    
+    pending = [index for index, result in enumerate(results) if result is None]
+    item_budget = LLM_BATCH_TOKEN_BUDGET - BATCH_PROMPT_OVERHEAD
+    batches = pack_batches(pending, lambda index: cost(items[index]), item_budget, LLM_BATCH_MAX_SECTIONS)
+    
+    def run_batch(batch: List[int]) -> Dict[int, Dict]:
+        answers = {}
+        if len(batch) > 1:
+            try:
+                with span("llm_batch", sections=len(batch), llm_calls=1):
+                    response = query_llm(
+                        build_prompt([items[index] for index in batch]), LLM_MAX_TOKENS * len(batch)
+                    )
+                for position, answer in parse_batch_results(response, len(batch), required_fields).items():
+                    index = batch[position]
+                    llm_cache.set(cache_key(items[index]), answer)
+                    answers[index] = answer
+            except Exception as e:
+                print(f"Batched LLM query failed, falling back to per-section calls: {e}")
+        for index in batch:
+            if index not in answers:
+                answers[index] = analyze_single(items[index])
+        return answers
+    
+    for answers in run_concurrently(run_batch, batches, max_workers):
+        for index, answer in answers.items():
+            results[index] = answer
+    return results
+
+def analyze_added_sections(
+    added_sections: List[SectionChange],
+    max_workers: Optional[int] = None,
+    bypass_cache: bool = LLM_CACHE_BYPASS,
+    batch: bool = LLM_BATCH_MODE
+) -> List[Dict]:
+    """
+    Public interface for analyzing added sections.
+    With batch enabled, several sections share one prompt up to the token budget.
     """
     if not added_sections:
         return []
     
-    return [analyze_changes_with_llm(section) for section in added_sections]
+    analyze_single = lambda section: analyze_changes_with_llm(section, bypass_cache)
+    if not batch:
+        return run_concurrently(analyze_single, added_sections, max_workers)
+    
+    return _analyze_in_batches(
+        added_sections,
+        analyze_single,
+        build_added_batch_prompt,
+        lambda section: llm_cache.make_key(MODEL_NAME, ADDED_BATCH_PROMPT_VERSION, section.title, section.content),
+        lambda section: estimate_tokens(section.title) + estimate_tokens(section.content) + 20,
+        ["change_summary", "change_type"],
+        max_workers,
+        bypass_cache
+    )
 
-def analyze_modified_sections(modified_sections: Dict[str, Dict[str, str]]) -> Dict[str, Dict]:
+def analyze_modified_sections(
+    modified_sections: Dict[str, Dict[str, str]],
+    max_workers: Optional[int] = None,
+    bypass_cache: bool = LLM_CACHE_BYPASS,
+    batch: bool = LLM_BATCH_MODE
+) -> Dict[str, Dict]:
     """
     Analyze modified sections with LLM
     Args:
         modified_sections: Dictionary {section_id: {'old': old_content, 'new': new_content}}
+        max_workers: Limit on this call's concurrent LLM requests, within LLM_CONCURRENCY
+        bypass_cache: Re-query the model instead of reusing cached responses
+        batch: Pack several sections into each prompt up to LLM_BATCH_TOKEN_BUDGET
     Returns:
         Dictionary {section_id: analysis_result} with same structure as added sections
     """
     if not modified_sections:
         return {}
 
-    results = {}
-    for section_id, content in modified_sections.items():
-        prompt = f"""
-        Analyze this regulatory document change and return JSON with:
-        - section_id: Original section identifier
-        - change_summary:  A one-sentence summary of the section's modification,output "INSIGNIFICANT" for cases you dont know answer to
-        - change_type: One of ["New Requirement", "Clarification", 
-                          "Stricter Requirement", "Looser Requirement", "Minor Edit"]
-        - change_impact: Low/Medium/High impact assessment
-
-        Section ID: {section_id}
-        OLD VERSION:
-        {content['old'][:400]}
-        NEW VERSION:
-        {content['new'][:400]}
-
-        Return ONLY valid JSON with no additional text or formatting:
-        {{
-            "section_id": "{section_id}",
-            "change_summary": "",
-            "change_type": "",
-            "change_impact": ""
-        }}
-        """
-        
-        try:
-            payload = {
-                "model": MODEL_NAME,
-                "prompt": prompt,
-                "format": "json",
-                "stream": False
-            }
-            response = requests.post(OLLAMA_API_URL, json=payload)
-            response.raise_for_status()
-            
-            # Ollama returns newline-delimited JSON
-            full_response = ""
-            for line in response.text.splitlines():
-                data = json.loads(line)
-                full_response += data.get("response", "")
-            
-            result = json.loads(full_response)
-            results[section_id] = result
-        except Exception as e:
-            print(f"Error analyzing section {section_id}: {e}")
-            results[section_id] = {
-                "section_id": section_id,
-                "change_summary": "Analysis failed",
-                "change_type": "Unknown",
-                "change_impact": "Unknown"
-            }
-
-    return results
\ No newline at end of file
+    items = list(modified_sections.items())
+    analyze_single = lambda item: analyze_modified_section(*item, bypass_cache)
+    if not batch:
+        analyses = run_concurrently(analyze_single, items, max_workers)
+    else:
+        analyses = _analyze_in_batches(
+            items,
+            analyze_single,
+            build_modified_batch_prompt,
+            lambda item: llm_cache.make_key(
+                MODEL_NAME, MODIFIED_BATCH_PROMPT_VERSION, item[0], item[1]['old'][:400], item[1]['new'][:400]
+            ),
+            lambda item: estimate_tokens(item[1]['old'][:400]) + estimate_tokens(item[1]['new'][:400]) + 30,
+            ["change_summary", "change_type", "change_impact"],
+            max_workers,
+            bypass_cache
+        )
+        for (section_id, _), analysis in zip(items, analyses):
+            analysis.setdefault("section_id", section_id)
+    return {section_id: analysis for (section_id, _), analysis in zip(items, analyses)}
+
@@ -1,63 +1,120 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from typing import List, Optional, Dict
+from contextlib import asynccontextmanager
+import json
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import List, Optional, Dict, Tuple
 from difference_utility import (
     SectionComparisonResult,
     ParagraphComparisonResult,
-    compare_sections,
-    analyze_paragraph_changes,
 )
-from llm_utility import analyze_added_sections, analyze_modified_sections
+from pipeline import (
+    get_comparison,
+    sections_stage,
+    paragraphs_stage,
+    added_ai_stage,
+    modified_ai_stage,
+    added_ai_stream,
+    modified_ai_stream,
+    version_diff,
+    version_paragraphs_stage,
+    diff_only_results,
+    streamed_sections_stage,
+    streamed_paragraphs_stage,
+)
+from sessions import ComparisonSession, create_session, get_session, session_store
+from cache import comparison_cache
+from llm_cache import llm_cache
+from llm_utility import ollama_client
+from config import LLM_CACHE_BYPASS, STREAMING_UPLOAD_THRESHOLD, GZIP_MIN_SIZE, GZIP_LEVEL
+from executors import pool_stats, shutdown_pools, run_blocking_io
+from triage import triage_stats
+from version_store import version_store
+from jobs import JOB_KINDS, Job, TooManyJobsError, job_manager
+from batch import load_pairs, manifest_entries, version_entries
+from metrics import EndpointMiddleware, span, stage_metrics, render_stats
+from compact import (
+    compact_sections,
+    compact_paragraphs,
+    compact_added_ai,
+    compact_modified_ai,
+    content_store,
+    encode_response,
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    job_manager.shutdown()
+    shutdown_pools()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(EndpointMiddleware)
+if GZIP_MIN_SIZE > 0:
+    # NDJSON streams are left uncompressed so each line reaches the client as soon as it is ready
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=GZIP_MIN_SIZE,
+        compresslevel=GZIP_LEVEL,
+        exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/x-ndjson",)
+    )
+
+async def read_uploads(old_version: UploadFile, new_version: UploadFile) -> Tuple[str, str]:
+    """Read and decode both uploaded documents"""
+    with span("decode_upload") as attributes:
+        old_bytes = await old_version.read()
+        new_bytes = await new_version.read()
+        attributes["bytes"] = len(old_bytes) + len(new_bytes)
+        return old_bytes.decode('utf-8'), new_bytes.decode('utf-8')
 
-app = FastAPI()
+def is_large_upload(*uploads: UploadFile) -> bool:
+    """Uploads above STREAMING_UPLOAD_THRESHOLD are compared without reading them whole"""
+    return any((upload.size or 0) > STREAMING_UPLOAD_THRESHOLD for upload in uploads)
 
 @app.post("/compare/sections", response_model=SectionComparisonResult)
 async def compare_sections_endpoint(
+    request: Request,
     old_version: UploadFile = File(...),
-    new_version: UploadFile = File(...)
+    new_version: UploadFile = File(...),
+    compact: bool = False
 ):
     """First-pass comparison identifying added/deleted sections"""
     try:
-        old_text = (await old_version.read()).decode('utf-8')
-        new_text = (await new_version.read()).decode('utf-8')
-        
-        comparison = compare_sections(old_text, new_text)
-        
-        return SectionComparisonResult(
-            added_sections=comparison['added_sections'],
-            deleted_sections=comparison['deleted_sections']
-        )
+        if is_large_upload(old_version, new_version):
+            result = await streamed_sections_stage(old_version.file, new_version.file)
+        else:
+            old_text, new_text = await read_uploads(old_version, new_version)
+            result = await sections_stage(old_text, new_text)
+
+        return encode_response(request, result, compact_sections if compact else None)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/compare/paragraphs", response_model=Dict[str, ParagraphComparisonResult])
 async def compare_paragraphs_endpoint(
+    request: Request,
     old_version: UploadFile = File(...),
     new_version: UploadFile = File(...),
-    section_filter: Optional[List[str]] = None
+    section_filter: Optional[List[str]] = None,
+    diff_only: bool = False,
+    compact: bool = False
 ):
-    """Second-pass comparison analyzing paragraph changes in modified sections"""
-    try:
-        old_text = (await old_version.read()).decode('utf-8')
-        new_text = (await new_version.read()).decode('utf-8')
-        
-        comparison = compare_sections(old_text, new_text)
-        results = {}
-        
-        # Filter sections to analyze if specified
-        sections_to_analyze = section_filter if section_filter else comparison['common_sections']
-        
-        for section_id in sections_to_analyze:
-            if section_id not in comparison['common_sections']:
-                continue
-            
-            old_content = comparison['old_section_map'][section_id]
-            new_content = comparison['new_section_map'][section_id]
-            
-            if old_content != new_content:
-                para_results = analyze_paragraph_changes(old_content, new_content)
-                results[section_id] = para_results
-        
-        return results
+    """
+    Second-pass comparison analyzing paragraph changes in modified sections.
+    diff_only leaves out new_paragraph of modified paragraphs, which their diff reproduces.
+    compact also replaces long paragraph texts with content hashes.
+    """
+    try:
+        if is_large_upload(old_version, new_version):
+            results = await streamed_paragraphs_stage(old_version.file, new_version.file, section_filter)
+        else:
+            old_text, new_text = await read_uploads(old_version, new_version)
+            results = await paragraphs_stage(old_text, new_text, section_filter)
+
+        if diff_only:
+            results = diff_only_results(results)
+        return encode_response(request, results, compact_paragraphs if compact else None)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -65,44 +122,77 @@ async def compare_paragraphs_endpoint(
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/stats")
+async def stats():
+    return {
+        "cache": comparison_cache.stats(),
+        "sessions": session_store.stats(),
+        "content_store": content_store.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm": ollama_client.stats(),
+        "triage": triage_stats.stats(),
+        "jobs": job_manager.stats(),
+        "pools": pool_stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage timings and counters plus the /stats values, in the Prometheus text format"""
+    return stage_metrics.render() + render_stats(await stats())
+
+@app.get("/content/{content_hash}", response_class=PlainTextResponse)
+async def get_content(content_hash: str):
+    """Full text behind a "..._ref" of a compact response"""
+    text = content_store.get(content_hash)
+    if text is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired content '{content_hash}'")
+    return text
+
+@app.post("/content")
+async def get_contents(content_hashes: List[str]):
+    """Several texts at once as {content_hash: text}; unknown or expired hashes are left out"""
+    texts = {content_hash: content_store.get(content_hash) for content_hash in content_hashes}
+    return {content_hash: text for content_hash, text in texts.items() if text is not None}
+
 @app.post("/added/ai", response_model=List[Dict])
 async def analyze_added_sections_with_ai(
+    request: Request,
     old_version: UploadFile = File(...),
-    new_version: UploadFile = File(...)
+    new_version: UploadFile = File(...),
+    bypass_cache: bool = LLM_CACHE_BYPASS,
+    compact: bool = False
 ):
     """
     Analyze added sections with AI
     """
     try:
-        old_text = (await old_version.read()).decode('utf-8')
-        new_text = (await new_version.read()).decode('utf-8')
-        
-        comparison = compare_sections(old_text, new_text)
-        added_sections = comparison['added_sections']
-        
-        # Analyze added sections with LLM
-        analysis_results = analyze_added_sections(added_sections)
-        
-        # Combine section data with analysis
-        results = []
-        for section, analysis in zip(added_sections, analysis_results):
-            results.append({
-                "section_title": section.title,
-                "section_content": section.content,
-                "analysis": analysis
-            })
-        
-        return results
+        old_text, new_text = await read_uploads(old_version, new_version)
+
+        return encode_response(
+            request, await added_ai_stage(old_text, new_text, bypass_cache), compact_added_ai if compact else None
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def set_skipped_header(response: Response, results: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Report how many sections were triaged locally instead of sent to the LLM"""
+    skipped = sum(1 for result in results.values() if result.get('triaged'))
+    response.headers["X-LLM-Calls-Skipped"] = str(skipped)
+    return results
+
 @app.post("/modified/ai", response_model=Dict[str, Dict])
 async def analyze_modified_sections_with_ai(
+    request: Request,
+    response: Response,
     old_version: UploadFile = File(...),
-    new_version: UploadFile = File(...)
+    new_version: UploadFile = File(...),
+    bypass_cache: bool = LLM_CACHE_BYPASS,
+    compact: bool = False
 ):
     """
-    Analyze modified sections with AI
+    Analyze modified sections with AI.
+    Cosmetic-only edits are classified locally with "triaged": true; the
+    X-LLM-Calls-Skipped header counts them.
     Returns:
         {
             "section_id": {
@@ -115,28 +205,322 @@ async def analyze_modified_sections_with_ai(
         }
     """
     try:
-        old_text = (await old_version.read()).decode('utf-8')
-        new_text = (await new_version.read()).decode('utf-8')
-        
-        comparison = compare_sections(old_text, new_text)
-        modified_sections = {
-            section_id: {
-                'old': comparison['old_section_map'][section_id],
-                'new': comparison['new_section_map'][section_id]
-            }
-            for section_id in comparison['common_sections']
-            if comparison['old_section_map'][section_id] != comparison['new_section_map'][section_id]
-        }
+        old_text, new_text = await read_uploads(old_version, new_version)
+
+        results = set_skipped_header(response, await modified_ai_stage(old_text, new_text, bypass_cache))
+        return encode_response(request, results, compact_modified_ai if compact else None, response)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/added/ai/stream")
+async def stream_added_sections_with_ai(
+    old_version: UploadFile = File(...),
+    new_version: UploadFile = File(...),
+    bypass_cache: bool = LLM_CACHE_BYPASS
+):
+    """
+    Streaming variant of /added/ai.
+    Emits NDJSON lines {"index", "total", "section_title", "section_content", "analysis"}
+    in completion order, one per added section.
+    """
+    try:
+        old_text, new_text = await read_uploads(old_version, new_version)
+
+        stream = await added_ai_stream(old_text, new_text, bypass_cache)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+@app.post("/modified/ai/stream")
+async def stream_modified_sections_with_ai(
+    old_version: UploadFile = File(...),
+    new_version: UploadFile = File(...),
+    bypass_cache: bool = LLM_CACHE_BYPASS
+):
+    """
+    Streaming variant of /modified/ai.
+    Emits NDJSON lines {"index", "total", "section_id", "change_summary", "change_type",
+    "change_impact", "old_content", "new_content"} in completion order, one per modified section.
+    Cosmetic-only edits are classified locally and carry "triaged": true.
+    """
+    try:
+        old_text, new_text = await read_uploads(old_version, new_version)
+
+        stream = await modified_ai_stream(old_text, new_text, bypass_cache)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+# Session API: upload both documents once, then fetch each stage by comparison ID
+
+def require_session(comparison_id: str) -> ComparisonSession:
+    session = get_session(comparison_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired comparison '{comparison_id}'")
+    return session
 
-        analysis_results = analyze_modified_sections(modified_sections)
-        
-        # Enrich with content snippets
-        for section_id, result in analysis_results.items():
-            result.update({
-                'old_content': modified_sections[section_id]['old'][:500] + '...',
-                'new_content': modified_sections[section_id]['new'][:500] + '...'
-            })
-        
-        return analysis_results
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+@app.post("/analyze")
+async def create_analysis(
+    old_version: UploadFile = File(...),
+    new_version: UploadFile = File(...)
+):
+    """
+    Upload a document pair once and get a comparison ID for the /analyze/{comparison_id}/... stages.
+    The documents are parsed here, so every stage reuses the same section comparison.
+    """
+    try:
+        old_text, new_text = await read_uploads(old_version, new_version)
+
+        comparison_id = create_session(old_text, new_text)
+        await get_comparison(old_text, new_text)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "comparison_id": comparison_id,
+        "stages": ["sections", "paragraphs", "added_ai", "modified_ai"]
+    }
+
+@app.get("/analyze/{comparison_id}")
+async def get_analysis(comparison_id: str):
+    """Check that a comparison is still available"""
+    require_session(comparison_id)
+    return {"comparison_id": comparison_id}
+
+@app.get("/analyze/{comparison_id}/sections", response_model=SectionComparisonResult)
+async def analysis_sections(comparison_id: str, request: Request, compact: bool = False):
+    session = require_session(comparison_id)
+    try:
+        result = await sections_stage(session.old_text, session.new_text)
+        return encode_response(request, result, compact_sections if compact else None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analyze/{comparison_id}/paragraphs", response_model=Dict[str, ParagraphComparisonResult])
+async def analysis_paragraphs(comparison_id: str, request: Request, diff_only: bool = False, compact: bool = False):
+    session = require_session(comparison_id)
+    try:
+        results = await paragraphs_stage(session.old_text, session.new_text)
+        if diff_only:
+            results = diff_only_results(results)
+        return encode_response(request, results, compact_paragraphs if compact else None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analyze/{comparison_id}/added_ai", response_model=List[Dict])
+async def analysis_added_ai(
+    comparison_id: str,
+    request: Request,
+    bypass_cache: bool = LLM_CACHE_BYPASS,
+    compact: bool = False
+):
+    session = require_session(comparison_id)
+    try:
+        results = await added_ai_stage(session.old_text, session.new_text, bypass_cache)
+        return encode_response(request, results, compact_added_ai if compact else None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analyze/{comparison_id}/modified_ai", response_model=Dict[str, Dict])
+async def analysis_modified_ai(
+    comparison_id: str,
+    request: Request,
+    response: Response,
+    bypass_cache: bool = LLM_CACHE_BYPASS,
+    compact: bool = False
+):
+    session = require_session(comparison_id)
+    try:
+        results = set_skipped_header(
+            response, await modified_ai_stage(session.old_text, session.new_text, bypass_cache)
+        )
+        return encode_response(request, results, compact_modified_ai if compact else None, response)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analyze/{comparison_id}/added_ai/stream")
+async def analysis_added_ai_stream(comparison_id: str, bypass_cache: bool = LLM_CACHE_BYPASS):
+    session = require_session(comparison_id)
+    try:
+        stream = await added_ai_stream(session.old_text, session.new_text, bypass_cache)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+@app.get("/analyze/{comparison_id}/modified_ai/stream")
+async def analysis_modified_ai_stream(comparison_id: str, bypass_cache: bool = LLM_CACHE_BYPASS):
+    session = require_session(comparison_id)
+    try:
+        stream = await modified_ai_stream(session.old_text, session.new_text, bypass_cache)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+# Background jobs: start an AI analysis, then poll /jobs/{job_id} for progress and the result
+
+def submit_job(kind: str, old_text: str, new_text: str, bypass_cache: bool) -> Job:
+    if kind not in JOB_KINDS:
+        raise HTTPException(status_code=404, detail=f"Unknown job kind '{kind}', expected one of {list(JOB_KINDS)}")
+    try:
+        return job_manager.submit(kind, old_text, new_text, bypass_cache)
+    except TooManyJobsError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@app.post("/jobs/{kind}", status_code=202)
+async def create_job(
+    kind: str,
+    old_version: UploadFile = File(...),
+    new_version: UploadFile = File(...),
+    bypass_cache: bool = LLM_CACHE_BYPASS
+):
+    """
+    Start an "added_ai" or "modified_ai" analysis in the background and return its job ID.
+    The finished job's result has the same shape as /added/ai or /modified/ai.
+    """
+    try:
+        old_text, new_text = await read_uploads(old_version, new_version)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return submit_job(kind, old_text, new_text, bypass_cache).summary()
+
+@app.post("/analyze/{comparison_id}/jobs/{kind}", status_code=202)
+async def create_analysis_job(comparison_id: str, kind: str, bypass_cache: bool = LLM_CACHE_BYPASS):
+    """Background job for an uploaded comparison"""
+    session = require_session(comparison_id)
+    return submit_job(kind, session.old_text, session.new_text, bypass_cache).summary()
+
+@app.get("/jobs")
+async def list_jobs():
+    return {"jobs": job_manager.list()}
+
+def require_job(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job '{job_id}'")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress (sections done out of total); includes "result" once done"""
+    return require_job(job_id).summary(include_result=True)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job; finished jobs are returned unchanged"""
+    require_job(job_id)
+    return job_manager.cancel(job_id).summary()
+
+# Batch comparisons: many document pairs in one background job
+
+@app.post("/batch", status_code=202)
+async def create_batch(
+    documents: List[UploadFile] = File(...),
+    manifest: Optional[str] = Form(None),
+    ai: bool = False,
+    diff_only: bool = False,
+    bypass_cache: bool = LLM_CACHE_BYPASS
+):
+    """
+    Compare many document pairs in a background job; /jobs/{job_id} has the progress and,
+    once done, {"summary": ..., "pairs": [...]}.
+    manifest is a JSON list of {"id", "old", "new"} entries naming uploaded files. Without it,
+    uploads sharing a folder in their filename ("eu/v1.txt", "eu/v2.txt") are successive versions.
+    """
+    try:
+        texts = {}
+        with span("decode_upload") as attributes:
+            for document in documents:
+                if document.filename in texts:
+                    raise ValueError(f"Duplicate document name '{document.filename}'")
+                data = await document.read()
+                attributes["bytes"] = attributes.get("bytes", 0) + len(data)
+                texts[document.filename] = data.decode('utf-8')
+
+        entries = manifest_entries(json.loads(manifest)) if manifest else version_entries(texts)
+        if not entries:
+            raise ValueError("No document pairs to compare")
+        missing = sorted({name for _, old_name, new_name in entries for name in (old_name, new_name)} - texts.keys())
+        if missing:
+            raise ValueError(f"Manifest names documents that were not uploaded: {missing}")
+        pairs = load_pairs(entries, texts.__getitem__)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        job = job_manager.submit_batch(pairs, ai=ai, diff_only=diff_only, bypass_cache=bypass_cache)
+    except TooManyJobsError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.summary()
+
+# Versioned regulation store: upload each revision once, then diff any two by section fingerprints
+
+@app.post("/regulations/{regulation_id}/versions/{version}")
+async def add_regulation_version(regulation_id: str, version: str, document: UploadFile = File(...)):
+    """Store a parsed revision; returns its section count and how many sections were new"""
+    try:
+        with span("decode_upload") as attributes:
+            data = await document.read()
+            attributes["bytes"] = len(data)
+            text = data.decode('utf-8')
+        return await run_blocking_io(version_store.add_version, regulation_id, version, text)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/regulations/{regulation_id}/versions")
+async def list_regulation_versions(regulation_id: str):
+    """Stored versions, oldest first"""
+    return {"regulation_id": regulation_id, "versions": version_store.list_versions(regulation_id)}
+
+async def require_version_diff(regulation_id: str, from_version: Optional[str], to_version: Optional[str]) -> Dict:
+    try:
+        return await version_diff(regulation_id, from_version, to_version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+@app.get("/regulations/{regulation_id}/diff")
+async def diff_regulation_versions(
+    regulation_id: str,
+    request: Request,
+    from_version: Optional[str] = None,
+    to_version: Optional[str] = None,
+    compact: bool = False
+):
+    """
+    Added, deleted, moved and renamed sections plus the keys of modified sections between two stored versions.
+    to_version defaults to the latest version and from_version to the one before it.
+    """
+    diff = await require_version_diff(regulation_id, from_version, to_version)
+    return encode_response(request, {
+        "from_version": diff['from_version'],
+        "to_version": diff['to_version'],
+        "added_sections": diff['added_sections'],
+        "deleted_sections": diff['deleted_sections'],
+        "moved_sections": diff['moved_sections'],
+        "renamed_sections": diff['renamed_sections'],
+        "modified_sections": list(diff['modified_sections']),
+        "unchanged_sections": diff['unchanged_sections']
+    }, compact_sections if compact else None)
+
+@app.get("/regulations/{regulation_id}/diff/paragraphs", response_model=Dict[str, ParagraphComparisonResult])
+async def diff_regulation_paragraphs(
+    regulation_id: str,
+    request: Request,
+    from_version: Optional[str] = None,
+    to_version: Optional[str] = None,
+    diff_only: bool = False,
+    compact: bool = False
+):
+    """Paragraph changes in the sections modified between two stored versions"""
+    diff = await require_version_diff(regulation_id, from_version, to_version)
+    try:
+        results = await version_paragraphs_stage(diff)
+        if diff_only:
+            results = diff_only_results(results)
+        return encode_response(request, results, compact_paragraphs if compact else None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
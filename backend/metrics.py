@@ -0,0 +1,152 @@
+import bisect
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+from config import METRICS_LOG, METRICS_BUCKETS
+
+# Route template of the request being served, e.g. "/analyze/{comparison_id}/sections"
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar("current_endpoint", default="")
+
+logger = logging.getLogger("regdiff.metrics")
+if METRICS_LOG:
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+class StageMetrics:
+    """
+    Timing histograms and item counters per (stage, endpoint), rendered in the
+    Prometheus text exposition format
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = METRICS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # (stage, endpoint) -> [bucket counts..., +Inf count], sum
+        self._histograms: Dict[Tuple[str, str], List] = {}
+        # (stage, endpoint, item) -> total
+        self._counters: Dict[Tuple[str, str, str], float] = {}
+
+    def observe(self, stage: str, seconds: float, attributes: Dict[str, Any]) -> None:
+        """Record a finished span"""
+        endpoint = current_endpoint.get()
+        with self._lock:
+            counts, total = self._histograms.get((stage, endpoint), ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self._histograms[(stage, endpoint)] = (counts, total + seconds)
+            self._add_counts(stage, endpoint, attributes)
+
+        if METRICS_LOG:
+            logger.info(json.dumps({
+                "stage": stage,
+                "endpoint": endpoint,
+                "duration_ms": round(seconds * 1000, 3),
+                **attributes
+            }, default=str))
+
+    def count(self, stage: str, **items: float) -> None:
+        """Add to a stage's item counters without timing anything"""
+        with self._lock:
+            self._add_counts(stage, current_endpoint.get(), items)
+
+    def _add_counts(self, stage: str, endpoint: str, items: Dict[str, Any]) -> None:
+        for item, value in items.items():
+            if isinstance(value, (bool, int, float)):
+                key = (stage, endpoint, item)
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self) -> str:
+        lines = [
+            "# HELP regdiff_stage_duration_seconds Time spent in each pipeline stage",
+            "# TYPE regdiff_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            histograms = {key: (list(counts), total) for key, (counts, total) in self._histograms.items()}
+            counters = dict(self._counters)
+
+        for (stage, endpoint), (counts, total) in sorted(histograms.items()):
+            labels = {"stage": stage, "endpoint": endpoint}
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"regdiff_stage_duration_seconds_bucket{_labels({**labels, 'le': le})} {cumulative}")
+            lines.append(f"regdiff_stage_duration_seconds_sum{_labels(labels)} {total}")
+            lines.append(f"regdiff_stage_duration_seconds_count{_labels(labels)} {cumulative}")
+
+        lines += [
+            "# HELP regdiff_stage_items_total Items processed per stage (sections, paragraph pairs, cache hits, ...)",
+            "# TYPE regdiff_stage_items_total counter",
+        ]
+        for (stage, endpoint, item), value in sorted(counters.items()):
+            labels = {"stage": stage, "endpoint": endpoint, "item": item}
+            lines.append(f"regdiff_stage_items_total{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+stage_metrics = StageMetrics()
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """
+    Time a block as `stage`. The yielded dict holds attributes recorded with the span;
+    numeric and boolean ones (section counts, cache hits, ...) are also summed as counters.
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException:
+        attributes["errors"] = 1
+        raise
+    finally:
+        stage_metrics.observe(stage, time.perf_counter() - start, attributes)
+
+def render_stats(stats: Dict[str, Any], prefix: str = "regdiff") -> str:
+    """
+    Numeric /stats values as Prometheus gauges: {"cache": {"hits": 3}} becomes
+    regdiff_cache_hits 3, and one more level of nesting becomes a "name" label
+    """
+    lines = []
+    for group, values in stats.items():
+        if not isinstance(values, dict):
+            continue
+        for key, value in values.items():
+            if isinstance(value, dict):
+                for metric, inner in value.items():
+                    if isinstance(inner, (bool, int, float)):
+                        lines.append(f"{prefix}_{group}_{metric}{_labels({'name': key})} {float(inner)}")
+            elif isinstance(value, (bool, int, float)):
+                lines.append(f"{prefix}_{group}_{key} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+class EndpointMiddleware:
+    """ASGI middleware recording the matched route template in current_endpoint"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            endpoint = ""
+            for route in scope["app"].router.routes:
+                match, _ = route.matches(scope)
+                if match.name == "FULL":
+                    endpoint = route.path
+                    break
+            current_endpoint.set(endpoint)
+        await self.app(scope, receive, send)
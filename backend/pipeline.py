@@ -0,0 +1,368 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from difference_utility import (
+    SectionComparisonResult,
+    ParagraphComparisonResult,
+    compare_sections,
+    compare_section_offsets,
+    analyze_section_paragraphs,
+    get_changed_sections,
+    generate_cache_key,
+    section_fingerprint,
+    section_result,
+    share_documents,
+)
+from tokenizer import iter_text_chunks
+from llm_utility import (
+    analyze_added_sections,
+    analyze_modified_sections,
+    analyze_changes_with_llm,
+    analyze_modified_section,
+)
+from cache import comparison_cache
+from triage import triage_modified_sections
+from config import (
+    TRIAGE_ENABLED,
+    PARALLEL_PARAGRAPHS,
+    PARALLEL_PARAGRAPHS_MIN_SECTIONS,
+    PARAGRAPH_CHUNKS_PER_WORKER,
+)
+from executors import run_cpu_bound, run_blocking_io, run_llm, balance_chunks, cpu_workers
+from version_store import version_store
+from metrics import span, stage_metrics
+
+# Comparison stages shared by the upload endpoints and the /analyze session API
+
+async def cached_stage(stage: str, key: Any, compute: Callable[[], Any]) -> Any:
+    """comparison_cache lookup that counts hits and misses under the stage's metrics"""
+    computed = False
+
+    async def tracked():
+        nonlocal computed
+        computed = True
+        return await compute()
+
+    result = await comparison_cache.get_or_compute_async((stage, key), tracked)
+    stage_metrics.count(stage, cache_hits=int(not computed), cache_misses=int(computed))
+    return result
+
+def section_counts(comparison: Dict) -> Dict[str, int]:
+    return {
+        "old_sections": len(comparison['old_section_map']),
+        "new_sections": len(comparison['new_section_map']),
+        "added_sections": len(comparison['added_sections']),
+        "deleted_sections": len(comparison['deleted_sections']),
+    }
+
+def paragraph_counts(results: Dict[str, ParagraphComparisonResult]) -> Dict[str, int]:
+    return {
+        "sections": len(results),
+        "paragraph_pairs": sum(len(result.modified_paragraphs) for result in results.values()),
+        "added_paragraphs": sum(len(result.added_paragraphs) for result in results.values()),
+        "deleted_paragraphs": sum(len(result.deleted_paragraphs) for result in results.values()),
+    }
+
+async def get_comparison(old_text: str, new_text: str) -> Dict:
+    """compare_sections output for a document pair, shared across endpoints"""
+    key = generate_cache_key(old_text, new_text)
+
+    async def compute():
+        with span('sections') as attributes:
+            comparison = share_documents(
+                await run_cpu_bound(compare_section_offsets, old_text, new_text), old_text, new_text
+            )
+            attributes.update(section_counts(comparison))
+        return comparison
+
+    return await cached_stage('sections', key, compute)
+
+async def get_paragraph_results(old_text: str, new_text: str) -> Dict[str, ParagraphComparisonResult]:
+    """Paragraph analysis of every changed common section, shared across endpoints"""
+    key = generate_cache_key(old_text, new_text)
+
+    async def compute():
+        comparison = await get_comparison(old_text, new_text)
+        return await analyze_paragraphs_parallel(get_changed_sections(comparison))
+
+    return await cached_stage('paragraphs', key, compute)
+
+async def analyze_paragraphs_parallel(changed_sections: List) -> Dict[str, ParagraphComparisonResult]:
+    """
+    Spread changed sections over the CPU pool in size-balanced chunks, largest first,
+    and merge the results back in section order
+    """
+    with span('paragraphs') as attributes:
+        results = await _analyze_paragraphs(changed_sections)
+        attributes.update(paragraph_counts(results))
+    return results
+
+async def _analyze_paragraphs(changed_sections: List) -> Dict[str, ParagraphComparisonResult]:
+    if not PARALLEL_PARAGRAPHS or len(changed_sections) < PARALLEL_PARAGRAPHS_MIN_SECTIONS:
+        return await run_cpu_bound(analyze_section_paragraphs, changed_sections)
+
+    chunks = balance_chunks(
+        changed_sections,
+        cpu_workers() * PARAGRAPH_CHUNKS_PER_WORKER,
+        size=lambda section: len(section[1]) + len(section[2])
+    )
+    partial_results = await asyncio.gather(
+        *(run_cpu_bound(analyze_section_paragraphs, chunk) for chunk in chunks)
+    )
+
+    merged = {}
+    for partial in partial_results:
+        merged.update(partial)
+    return {section_id: merged[section_id] for section_id, _, _ in changed_sections}
+
+def get_modified_sections(comparison: Dict) -> Dict[str, Dict[str, str]]:
+    """{section_id: {'old': ..., 'new': ...}} for common sections whose text differs"""
+    return {
+        section_id: {'old': old_content, 'new': new_content}
+        for section_id, old_content, new_content in get_changed_sections(comparison)
+    }
+
+async def triage_sections(
+    old_text: str,
+    new_text: str,
+    modified_sections: Dict[str, Dict[str, str]]
+) -> Tuple[Dict[str, Dict[str, str]], Dict[str, Dict]]:
+    """
+    Split modified sections into those needing the LLM and local analyses of cosmetic-only edits,
+    reusing the cached paragraph diff
+    """
+    if not TRIAGE_ENABLED:
+        return modified_sections, {}
+    paragraph_results = await get_paragraph_results(old_text, new_text)
+    with span('triage', sections=len(modified_sections)) as attributes:
+        substantive, cosmetic = triage_modified_sections(modified_sections, paragraph_results)
+        attributes["llm_calls_skipped"] = len(cosmetic)
+    return substantive, cosmetic
+
+def added_section_result(section, analysis: Dict) -> Dict:
+    """Combine an added section with its analysis"""
+    return {
+        "section_title": section.title,
+        "section_content": section.content,
+        "analysis": analysis
+    }
+
+def modified_section_result(content: Dict[str, str], analysis: Dict) -> Dict:
+    """Enrich a modified section's analysis with content snippets"""
+    analysis.update({
+        'old_content': content['old'][:500] + '...',
+        'new_content': content['new'][:500] + '...'
+    })
+    return analysis
+
+async def analyses_as_completed(items: List, analyze: Callable[[Any], Dict]) -> AsyncIterator[Tuple[int, Dict]]:
+    """
+    Run analyze over items on the shared LLM pool, which bounds model calls across all
+    requests, and yield (index, result) as each completes. Closing the iterator cancels
+    pending items.
+    """
+    async def run(index, item):
+        return index, await run_llm(analyze, item)
+
+    tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def stream_analyses(items: List, analyze: Callable[[Any], Dict]) -> AsyncIterator[str]:
+    """analyses_as_completed as NDJSON lines carrying index and total"""
+    async for index, result in analyses_as_completed(items, analyze):
+        yield json.dumps({"index": index, "total": len(items), **result}) + "\n"
+
+async def sections_stage(old_text: str, new_text: str) -> SectionComparisonResult:
+    """Added and deleted sections"""
+    comparison = await get_comparison(old_text, new_text)
+    return section_result(comparison)
+
+async def paragraphs_stage(
+    old_text: str,
+    new_text: str,
+    section_filter: Optional[List[str]] = None
+) -> Dict[str, ParagraphComparisonResult]:
+    """Paragraph changes in modified sections, optionally limited to section_filter"""
+    comparison = await get_comparison(old_text, new_text)
+    paragraph_results = await get_paragraph_results(old_text, new_text)
+    return filter_paragraph_results(comparison, paragraph_results, section_filter)
+
+def filter_paragraph_results(
+    comparison: Dict,
+    paragraph_results: Dict[str, ParagraphComparisonResult],
+    section_filter: Optional[List[str]]
+) -> Dict[str, ParagraphComparisonResult]:
+    # Filter sections to analyze if specified
+    sections_to_analyze = section_filter if section_filter else comparison['common_sections']
+
+    return {
+        section_id: paragraph_results[section_id]
+        for section_id in sections_to_analyze
+        if section_id in paragraph_results
+    }
+
+def diff_only_results(paragraph_results: Dict[str, ParagraphComparisonResult]) -> Dict[str, ParagraphComparisonResult]:
+    """
+    Drop new_paragraph from modified paragraphs, which old_paragraph plus the word-level
+    diff reproduce. Copies, so cached results keep their full text.
+    """
+    return {
+        section_id: result.model_copy(update={
+            'modified_paragraphs': [
+                change.model_copy(update={'new_paragraph': None}) for change in result.modified_paragraphs
+            ]
+        })
+        for section_id, result in paragraph_results.items()
+    }
+
+# Large uploads: split sections while reading the files instead of decoding them whole.
+# These results are not cached, since caching would keep every section in memory.
+
+async def get_streamed_comparison(old_file: BinaryIO, new_file: BinaryIO) -> Dict:
+    """compare_sections over two binary files, read in chunks on the I/O pool"""
+    with span('sections_streamed') as attributes:
+        comparison = await run_blocking_io(
+            compare_sections, iter_text_chunks(old_file), iter_text_chunks(new_file)
+        )
+        attributes.update(section_counts(comparison))
+    return comparison
+
+async def streamed_sections_stage(old_file: BinaryIO, new_file: BinaryIO) -> SectionComparisonResult:
+    """sections_stage for large uploads"""
+    comparison = await get_streamed_comparison(old_file, new_file)
+    return section_result(comparison)
+
+async def streamed_paragraphs_stage(
+    old_file: BinaryIO,
+    new_file: BinaryIO,
+    section_filter: Optional[List[str]] = None
+) -> Dict[str, ParagraphComparisonResult]:
+    """paragraphs_stage for large uploads"""
+    comparison = await get_streamed_comparison(old_file, new_file)
+    paragraph_results = await analyze_paragraphs_parallel(get_changed_sections(comparison))
+    return filter_paragraph_results(comparison, paragraph_results, section_filter)
+
+async def added_ai_stage(old_text: str, new_text: str, bypass_cache: bool) -> List[Dict]:
+    """LLM analysis of added sections"""
+    comparison = await get_comparison(old_text, new_text)
+    added_sections = comparison['added_sections']
+
+    # Analyze added sections with LLM
+    with span('added_ai', sections=len(added_sections)):
+        analysis_results = await run_blocking_io(
+            analyze_added_sections, added_sections, bypass_cache=bypass_cache
+        )
+
+    # Combine section data with analysis
+    return [
+        added_section_result(section, analysis)
+        for section, analysis in zip(added_sections, analysis_results)
+    ]
+
+async def modified_ai_stage(old_text: str, new_text: str, bypass_cache: bool) -> Dict[str, Dict]:
+    """
+    LLM analysis of modified sections, enriched with content snippets.
+    Cosmetic-only edits are classified locally and marked "triaged".
+    """
+    comparison = await get_comparison(old_text, new_text)
+    modified_sections = get_modified_sections(comparison)
+    substantive_sections, triaged_results = await triage_sections(old_text, new_text, modified_sections)
+
+    with span('modified_ai', sections=len(substantive_sections)):
+        llm_results = await run_blocking_io(
+            analyze_modified_sections, substantive_sections, bypass_cache=bypass_cache
+        )
+    analysis_results = {
+        section_id: llm_results[section_id] if section_id in llm_results else triaged_results[section_id]
+        for section_id in modified_sections
+    }
+
+    # Enrich with content snippets
+    for section_id, result in analysis_results.items():
+        modified_section_result(modified_sections[section_id], result)
+
+    return analysis_results
+
+async def prepare_added_ai(old_text: str, new_text: str, bypass_cache: bool) -> Tuple[List, Callable[[Any], Dict]]:
+    """Added sections and the per-section analysis used by the incremental AI stages"""
+    comparison = await get_comparison(old_text, new_text)
+
+    def analyze(section):
+        return added_section_result(section, analyze_changes_with_llm(section, bypass_cache))
+
+    return comparison['added_sections'], analyze
+
+async def prepare_modified_ai(old_text: str, new_text: str, bypass_cache: bool) -> Tuple[List, Callable[[Any], Dict]]:
+    """(section_id, content) items and the per-section analysis used by the incremental AI stages"""
+    comparison = await get_comparison(old_text, new_text)
+    modified_sections = get_modified_sections(comparison)
+    _, triaged_results = await triage_sections(old_text, new_text, modified_sections)
+
+    def analyze(item):
+        section_id, content = item
+        analysis = (
+            triaged_results[section_id] if section_id in triaged_results
+            else analyze_modified_section(section_id, content, bypass_cache)
+        )
+        # The model may echo a different section_id, so the key we analyzed wins
+        return {**modified_section_result(content, analysis), "section_id": section_id}
+
+    return list(modified_sections.items()), analyze
+
+async def added_ai_stream(old_text: str, new_text: str, bypass_cache: bool) -> AsyncIterator[str]:
+    """
+    Compare the documents, then return an NDJSON stream of added-section analyses.
+    Comparison errors surface before streaming starts.
+    """
+    return stream_analyses(*await prepare_added_ai(old_text, new_text, bypass_cache))
+
+async def modified_ai_stream(old_text: str, new_text: str, bypass_cache: bool) -> AsyncIterator[str]:
+    """
+    Compare the documents, then return an NDJSON stream of modified-section analyses.
+    Comparison errors surface before streaming starts.
+    """
+    return stream_analyses(*await prepare_modified_ai(old_text, new_text, bypass_cache))
+
+# Stored regulation versions
+
+async def version_diff(regulation_id: str, from_version: Optional[str], to_version: Optional[str]) -> Dict:
+    """
+    Fingerprint diff of two stored versions; to_version defaults to the latest and
+    from_version to the one stored before it
+    """
+    to_version = to_version or version_store.latest_version(regulation_id)
+    if to_version is None:
+        raise KeyError(f"No versions stored for regulation '{regulation_id}'")
+    from_version = from_version or version_store.previous_version(regulation_id, to_version)
+    if from_version is None:
+        raise KeyError(f"Version '{to_version}' of regulation '{regulation_id}' has no earlier version")
+
+    with span('version_diff') as attributes:
+        diff = await run_blocking_io(version_store.diff, regulation_id, from_version, to_version)
+        attributes.update(
+            added_sections=len(diff['added_sections']),
+            deleted_sections=len(diff['deleted_sections']),
+            modified_sections=len(diff['modified_sections'])
+        )
+    return {"from_version": from_version, "to_version": to_version, **diff}
+
+async def version_paragraphs_stage(diff: Dict) -> Dict[str, ParagraphComparisonResult]:
+    """
+    Paragraph changes in the modified sections of a version diff, cached by section
+    fingerprints so pairs shared across version comparisons are analyzed once
+    """
+    modified_sections = diff['modified_sections']
+    key = tuple(
+        (section_id, section_fingerprint(content['old']), section_fingerprint(content['new']))
+        for section_id, content in modified_sections.items()
+    )
+    changed_sections = [
+        (section_id, content['old'], content['new']) for section_id, content in modified_sections.items()
+    ]
+    return await cached_stage('version_paragraphs', key, lambda: analyze_paragraphs_parallel(changed_sections))
@@ -0,0 +1,228 @@
+import importlib.util
+import math
+import threading
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from config import (
+    SEMANTIC_MATCHING,
+    SEMANTIC_MIN_SIMILARITY,
+    SEMANTIC_MIN_TITLE_OVERLAP,
+    EMBEDDING_MODEL,
+    SEMANTIC_BLOCK_ROWS,
+    SEMANTIC_CANDIDATES,
+    SEMANTIC_DIMENSIONS,
+)
+from metrics import span
+from tokenizer import word_tokens
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class SemanticBackend(NamedTuple):
+    """
+    Vectorizes section texts for nearest-neighbour matching.
+    vectorize(old_texts, new_texts) returns L2-normalized row matrices, so their
+    product is the cosine similarity; min_similarity is the backend's default threshold and
+    min_title_overlap the share of title words a pair must have in common (0 disables it).
+    """
+    name: str
+    vectorize: Callable[[List[str], List[str]], Tuple["np.ndarray", "np.ndarray"]]
+    min_similarity: float
+    min_title_overlap: float
+
+def _normalize_rows(matrix: "np.ndarray") -> "np.ndarray":
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _project(old_vectors: "np.ndarray", new_vectors: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Gaussian random projection to SEMANTIC_DIMENSIONS for the candidate search, which
+    roughly preserves cosines (Johnson-Lindenstrauss); narrower vectors are used as they are
+    """
+    if old_vectors.shape[1] <= SEMANTIC_DIMENSIONS:
+        return old_vectors, new_vectors
+    generator = np.random.default_rng(0)
+    projection = generator.standard_normal((old_vectors.shape[1], SEMANTIC_DIMENSIONS), dtype=np.float32)
+    return _normalize_rows(old_vectors @ projection), _normalize_rows(new_vectors @ projection)
+
+def _tfidf_vectors(old_texts: List[str], new_texts: List[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Sublinear TF-IDF over both sides. Only terms occurring on both sides can contribute to
+    an old x new dot product, so columns are kept for those alone, while row norms still
+    count every term; the cosines are exact with a much smaller dense matrix.
+    """
+    old_counts = [Counter(word_tokens(text.lower())) for text in old_texts]
+    new_counts = [Counter(word_tokens(text.lower())) for text in new_texts]
+    frequency = Counter()
+    for counts in old_counts + new_counts:
+        frequency.update(counts.keys())
+    documents = len(old_counts) + len(new_counts)
+    idf = {term: math.log((1 + documents) / (1 + df)) + 1 for term, df in frequency.items()}
+
+    old_terms = set().union(*(counts.keys() for counts in old_counts))
+    new_terms = set().union(*(counts.keys() for counts in new_counts))
+    columns = {term: column for column, term in enumerate(sorted(old_terms & new_terms))}
+
+    def vectors(side: List[Counter]) -> "np.ndarray":
+        rows, terms, counts = [], [], []
+        for row, document in enumerate(side):
+            rows.extend([row] * len(document))
+            terms.extend(document.keys())
+            counts.extend(document.values())
+        rows = np.array(rows, dtype=np.int64)
+        weights = (1 + np.log(np.array(counts, dtype=np.float32))) * np.array(
+            [idf[term] for term in terms], dtype=np.float32
+        )
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(side)))
+        norms[norms == 0] = 1.0
+        shared = np.array([columns.get(term, -1) for term in terms], dtype=np.int64)
+        kept = shared >= 0
+
+        matrix = np.zeros((len(side), max(len(columns), 1)), dtype=np.float32)
+        matrix[rows[kept], shared[kept]] = weights[kept] / norms[rows[kept]]
+        return matrix
+
+    return vectors(old_counts), vectors(new_counts)
+
+_model = None
+_model_lock = threading.Lock()
+
+def _embedding_vectors(old_texts: List[str], new_texts: List[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Sentence embeddings from a local model, loaded on first use"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    embeddings = _model.encode(old_texts + new_texts, batch_size=32, convert_to_numpy=True)
+    embeddings = _normalize_rows(embeddings.astype(np.float32))
+    return embeddings[:len(old_texts)], embeddings[len(old_texts):]
+
+def _load_backends() -> Dict[str, SemanticBackend]:
+    backends = {}
+    if np is None:
+        return backends
+
+    # Checked without importing, which would load torch at startup
+    if importlib.util.find_spec('sentence_transformers') is not None:
+        backends['embedding'] = SemanticBackend('embedding', _embedding_vectors, 0.85, 0.0)
+
+    # Shared vocabulary alone pairs unrelated sections of the same document family (e.g. a
+    # table-of-contents entry with the section it lists), so TF-IDF pairs must share a title
+    backends['tfidf'] = SemanticBackend('tfidf', _tfidf_vectors, 0.6, 0.5)
+    return backends
+
+AVAILABLE_BACKENDS = _load_backends()
+
+def select_backend(name: str = SEMANTIC_MATCHING) -> Optional[SemanticBackend]:
+    """
+    Pick a backend by name; 'off' disables semantic matching and 'auto' prefers a local
+    embedding model, falling back to TF-IDF
+    """
+    if name == 'off':
+        return None
+    if name == 'auto':
+        for candidate in ('embedding', 'tfidf'):
+            if candidate in AVAILABLE_BACKENDS:
+                return AVAILABLE_BACKENDS[candidate]
+    if name not in AVAILABLE_BACKENDS:
+        raise ValueError(
+            f"Semantic matching backend '{name}' is not available "
+            f"(requires numpy, and sentence-transformers for 'embedding'), "
+            f"choose from {['off', *sorted(AVAILABLE_BACKENDS)]}"
+        )
+    return AVAILABLE_BACKENDS[name]
+
+# Selected once at startup
+semantic_backend = select_backend()
+
+def title_words(text: str) -> Set[str]:
+    """
+    Words of four or more letters on the first line that has any, so section numbers,
+    list markers such as "(a)" and line numbers don't count as a title
+    """
+    for line in text.split('\n'):
+        words = {word for word in word_tokens(line.lower()) if len(word) >= 4 and word.isalpha()}
+        if words:
+            return words
+    return set()
+
+def title_overlap(old_words: Set[str], new_words: Set[str]) -> float:
+    """Share of the shorter title's words that the other title also has"""
+    if not old_words or not new_words:
+        return 0.0
+    return len(old_words & new_words) / min(len(old_words), len(new_words))
+
+def match_semantic(
+    old_texts: List[str],
+    new_texts: List[str],
+    min_similarity: Optional[float] = None,
+    backend: Optional[SemanticBackend] = semantic_backend,
+    min_title_overlap: Optional[float] = None
+) -> List[Tuple[int, int, float]]:
+    """
+    One-to-one nearest-neighbour pairs of old and new texts by cosine similarity, assigned
+    greedily best-first like match_paragraphs. The similarity matrix is computed in blocks
+    of old rows, keeping the top SEMANTIC_CANDIDATES per row, so memory stays bounded;
+    wide vectors are searched in a random projection and the candidates rescored exactly.
+    Candidates whose titles share less than min_title_overlap are dropped before assignment.
+    Returns (old_index, new_index, similarity) tuples; empty when matching is off.
+    """
+    if backend is None or not old_texts or not new_texts:
+        return []
+    if min_similarity is None:
+        min_similarity = SEMANTIC_MIN_SIMILARITY if SEMANTIC_MIN_SIMILARITY is not None else backend.min_similarity
+    if min_title_overlap is None:
+        min_title_overlap = (
+            SEMANTIC_MIN_TITLE_OVERLAP if SEMANTIC_MIN_TITLE_OVERLAP is not None else backend.min_title_overlap
+        )
+
+    with span("semantic_match", backend=backend.name, old_sections=len(old_texts),
+              new_sections=len(new_texts)) as attributes:
+        old_vectors, new_vectors = backend.vectorize(old_texts, new_texts)
+        old_search, new_search = _project(old_vectors, new_vectors)
+        keep = min(SEMANTIC_CANDIDATES, len(new_texts))
+
+        candidates = []
+        for start in range(0, len(old_texts), SEMANTIC_BLOCK_ROWS):
+            block = old_search[start:start + SEMANTIC_BLOCK_ROWS] @ new_search.T
+            if keep < block.shape[1]:
+                columns = np.argpartition(-block, keep - 1, axis=1)[:, :keep]
+            else:
+                columns = np.broadcast_to(np.arange(block.shape[1]), block.shape)
+            if old_search is old_vectors:
+                scores = np.take_along_axis(block, columns, axis=1)
+            else:
+                # Projected scores only pick candidates; rescore them on the full vectors
+                rows = old_vectors[start:start + SEMANTIC_BLOCK_ROWS]
+                scores = np.einsum("rd,rkd->rk", rows, new_vectors[columns])
+            rows, picks = np.nonzero(scores >= min_similarity)
+            candidates.extend(zip(
+                scores[rows, picks].tolist(), (rows + start).tolist(), columns[rows, picks].tolist()
+            ))
+
+        if min_title_overlap > 0:
+            old_titles = [title_words(text) for text in old_texts]
+            new_titles = [title_words(text) for text in new_texts]
+            candidates = [
+                (similarity, i, j) for similarity, i, j in candidates
+                if title_overlap(old_titles[i], new_titles[j]) >= min_title_overlap
+            ]
+
+        # Best pairs first; prefer pairs closer in position on ties
+        candidates.sort(key=lambda c: (-c[0], abs(c[1] - c[2])))
+        used_old, used_new = set(), set()
+        matches = []
+        for similarity, i, j in candidates:
+            if i in used_old or j in used_new:
+                continue
+            used_old.add(i)
+            used_new.add(j)
+            matches.append((i, j, min(float(similarity), 1.0)))
+        attributes["matched"] = len(matches)
+
+    return sorted(matches)
@@ -0,0 +1,22 @@
+from typing import NamedTuple, Optional
+
+from cache import ComparisonCache
+from config import SESSION_STORE_SIZE, SESSION_TTL
+from difference_utility import generate_cache_key
+
+class ComparisonSession(NamedTuple):
+    """Decoded documents of a comparison created through /analyze"""
+    old_text: str
+    new_text: str
+
+# Comparison ID -> uploaded documents; parsed results live in comparison_cache under the same key
+session_store = ComparisonCache(max_size=SESSION_STORE_SIZE, ttl=SESSION_TTL)
+
+def create_session(old_text: str, new_text: str) -> str:
+    """Store a document pair and return its content-addressed comparison ID"""
+    comparison_id = generate_cache_key(old_text, new_text)
+    session_store.set(comparison_id, ComparisonSession(old_text, new_text))
+    return comparison_id
+
+def get_session(comparison_id: str) -> Optional[ComparisonSession]:
+    return session_store.get(comparison_id)
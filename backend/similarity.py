@@ -0,0 +1,68 @@
+import difflib
+from typing import Callable, Dict, NamedTuple
+
+from config import SIMILARITY_BACKEND
+
+class SimilarityBackend(NamedTuple):
+    """
+    A string similarity implementation and its modified-paragraph threshold.
+    ratio(a, b, score_cutoff) returns a score in [0, 1], or 0.0 when it can't exceed score_cutoff.
+    Native backends score the exact LCS ratio, which runs higher than difflib's heuristic
+    matching blocks, so their threshold is calibrated to pair paragraphs like difflib's 0.3.
+    Matched pairs have no upper bound: any pair whose normalized text differs is modified.
+    """
+    name: str
+    ratio: Callable[..., float]
+    min_modified: float
+
+def _difflib_ratio(a: str, b: str, score_cutoff: float = 0.0) -> float:
+    matcher = difflib.SequenceMatcher(None, a, b)
+    # Cheap upper bounds before the full ratio
+    if matcher.real_quick_ratio() <= score_cutoff or matcher.quick_ratio() <= score_cutoff:
+        return 0.0
+    return matcher.ratio()
+
+def _load_backends() -> Dict[str, SimilarityBackend]:
+    backends = {}
+
+    try:
+        import Levenshtein
+    except ImportError:
+        pass
+    else:
+        backends['levenshtein'] = SimilarityBackend(
+            'levenshtein',
+            lambda a, b, score_cutoff=0.0: Levenshtein.ratio(a, b, score_cutoff=score_cutoff),
+            0.46
+        )
+
+    try:
+        from rapidfuzz.distance import Indel
+    except ImportError:
+        pass
+    else:
+        backends['rapidfuzz'] = SimilarityBackend(
+            'rapidfuzz',
+            lambda a, b, score_cutoff=0.0: Indel.normalized_similarity(a, b, score_cutoff=score_cutoff),
+            0.46
+        )
+
+    backends['difflib'] = SimilarityBackend('difflib', _difflib_ratio, 0.3)
+    return backends
+
+AVAILABLE_BACKENDS = _load_backends()
+
+def select_backend(name: str = SIMILARITY_BACKEND) -> SimilarityBackend:
+    """Pick a backend by name; 'auto' prefers native implementations and falls back to difflib"""
+    if name == 'auto':
+        for candidate in ('levenshtein', 'rapidfuzz', 'difflib'):
+            if candidate in AVAILABLE_BACKENDS:
+                return AVAILABLE_BACKENDS[candidate]
+    if name not in AVAILABLE_BACKENDS:
+        raise ValueError(
+            f"Similarity backend '{name}' is not available, choose from {sorted(AVAILABLE_BACKENDS)}"
+        )
+    return AVAILABLE_BACKENDS[name]
+
+# Selected once at startup
+similarity_backend = select_backend()
@@ -0,0 +1,164 @@
+"""
+Minimal stand-in for the Ollama /api/generate endpoint, for testing and benchmarking offline.
+
+    python stub_ollama.py --port 11434 --latency 0.5
+
+Every prompt gets a fixed JSON analysis after the configured latency; batched prompts
+("Number of sections: N") get a "results" array with one analysis per section.
+Streamed requests ("stream": true) get the analysis as NDJSON chunks of a few characters,
+token_latency apart, followed by `ramble` chunks of trailing whitespace like a model that
+keeps generating past the closing brace; "options.num_predict" caps the chunk count.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+STUB_ANALYSIS = {
+    "change_summary": "Stub analysis of the section",
+    "change_type": "Clarification of Existing Requirement",
+    "change_impact": "Low"
+}
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            # The client closed the connection while a streamed response was still unread
+            pass
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        server.record_request()
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        time.sleep(delay)
+
+        if random.random() < server.fail_rate:
+            self._send(500, b'{"error": "stub failure"}')
+            return
+
+        tokens = server.tokens_for(payload)
+        if payload.get("stream"):
+            self._stream(payload, tokens)
+            return
+
+        time.sleep(server.token_latency * len(tokens))
+        server.record_tokens(len(tokens))
+        body = json.dumps({
+            "model": payload.get("model", "stub"),
+            "response": "".join(tokens),
+            "done": True
+        }).encode()
+        self._send(200, body)
+
+    def _stream(self, payload: Dict, tokens: List[str]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        model = payload.get("model", "stub")
+        try:
+            for token in tokens:
+                time.sleep(self.server.token_latency)
+                line = json.dumps({"model": model, "response": token, "done": False}).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                self.wfile.flush()
+                self.server.record_tokens(1)
+            line = json.dumps({"model": model, "response": "", "done": True, "eval_count": len(tokens)}).encode() + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(line), line))
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading early, like Ollama this stops generating
+            self.close_connection = True
+
+    def _send(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class StubOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 fail_rate: float = 0.0, verbose: bool = False, token_latency: float = 0.0,
+                 ramble: int = 0):
+        super().__init__(("127.0.0.1", port), StubOllamaHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.verbose = verbose
+        self.token_latency = token_latency
+        self.ramble = ramble
+        self.requests = 0
+        self.tokens = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/api/generate"
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_tokens(self, count: int) -> None:
+        with self._lock:
+            self.tokens += count
+
+    def tokens_for(self, payload: Dict) -> List[str]:
+        """The generated text in chunks of four characters, plus trailing whitespace, capped at num_predict"""
+        text = json.dumps(self.analysis_for(payload))
+        tokens = [text[start:start + 4] for start in range(0, len(text), 4)] + ["\n"] * self.ramble
+        limit = payload.get("options", {}).get("num_predict")
+        return tokens[:limit] if limit and limit > 0 else tokens
+
+    def analysis_for(self, payload: Dict) -> Dict:
+        batch = re.search(r"Number of sections: (\d+)", payload.get("prompt", ""))
+        if batch:
+            return {"results": [dict(STUB_ANALYSIS, index=index) for index in range(int(batch.group(1)))]}
+        return dict(STUB_ANALYSIS)
+
+    def start(self) -> "StubOllamaServer":
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Ollama server")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per generated chunk")
+    parser.add_argument("--ramble", type=int, default=0, help="chunks generated after the JSON object")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = StubOllamaServer(args.port, args.latency, args.jitter, args.fail_rate, args.verbose,
+                              args.token_latency, args.ramble)
+    print(f"Stub Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
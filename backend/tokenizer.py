@@ -0,0 +1,142 @@
+import codecs
+import re
+from functools import lru_cache
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+from config import SECTION_STREAM_CHUNK_SIZE, SECTION_STREAM_MARGIN, NORMALIZE_CACHE_SIZE
+
+# Section, paragraph and word patterns, compiled once.
+#
+# SECTION_BOUNDARY is a newline followed by a section header. It matches exactly the same
+# positions as the original pattern
+#   \n(?=\d+\.\d*\s+[A-Z][^\n]+|\n\[SECTION|ARTICLE|\n\s*[A-Z][A-Z\s]+\n|\n\s*[IVX]+\.\s|\n\s*\(\w\)\s)
+# but every lookahead stops as soon as the header is decided, so each newline costs at most
+# about one line of scanning: the "\n" prefix shared by three alternatives is tried once,
+# "[A-Z][^\n]" stops after one character instead of reading to the end of the line, and the
+# lazy "[A-Z][A-Z\s]+?\n" stops at the first newline instead of running to the end of a
+# capitals-and-whitespace block and backtracking from there (quadratic on such blocks).
+SECTION_BOUNDARY = re.compile(
+    r'\n(?=\d+\.\d*\s+[A-Z][^\n]|ARTICLE|\n(?:\[SECTION|\s*(?:[A-Z][A-Z\s]+?\n|[IVX]+\.\s|\(\w\)\s)))'
+)
+PARAGRAPH_BOUNDARY = re.compile(r'\n\s*\n|\n\s*[\-\*•]\s+')
+PUNCTUATION = re.compile(r'[^\w\s]')
+WHITESPACE = re.compile(r'\s+')
+WORD = re.compile(r'\w+')
+# Words, whitespace runs and single punctuation marks; joined back they give the original text
+DIFF_TOKEN = re.compile(r'\w+|\s+|[^\w\s]')
+
+NON_SPACE = re.compile(r'\S')
+
+def _stripped_span(text: str, start: int, end: int) -> Optional[Tuple[int, int]]:
+    """text[start:end] without surrounding whitespace, as offsets; None if it is all whitespace"""
+    match = NON_SPACE.search(text, start, end)
+    if match is None:
+        return None
+    while text[end - 1].isspace():
+        end -= 1
+    return match.start(), end
+
+def section_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the sections preprocess_text returns, without copying them"""
+    document = _stripped_span(text, 0, len(text))
+    if document is None:
+        return []
+    start, document_end = document
+    spans = []
+    # endpos makes the header lookaheads see the stripped document's end, as split on text.strip() did
+    for match in SECTION_BOUNDARY.finditer(text, start, document_end):
+        span = _stripped_span(text, start, match.start())
+        if span is not None:
+            spans.append(span)
+        start = match.end()
+    span = _stripped_span(text, start, document_end)
+    if span is not None:
+        spans.append(span)
+    return spans
+
+def preprocess_text(text: str) -> List[str]:
+    """Split text into sections with improved header detection"""
+    return [text[start:end] for start, end in section_spans(text)]
+
+def iter_sections(chunks: Iterable[str], margin: int = SECTION_STREAM_MARGIN) -> Iterator[str]:
+    """
+    Lazily split a stream of text chunks into the same sections as preprocess_text.
+    Boundaries are only decided once `margin` characters past them have arrived, so a
+    header whose lookahead spans more than `margin` characters (e.g. a huge whitespace run)
+    may be split differently. Memory is bounded by the largest section plus one chunk.
+    """
+    pending: List[str] = []  # text of the current section already past the margin
+    buffer = ''
+    started = False
+
+    def split_buffer(limit: int) -> Iterator[str]:
+        nonlocal buffer
+        start = 0
+        for match in SECTION_BOUNDARY.finditer(buffer):
+            if match.start() >= limit:
+                break
+            pending.append(buffer[start:match.start()])
+            section = ''.join(pending).strip()
+            pending.clear()
+            if section:
+                yield section
+            start = match.end()
+        # Park text before the limit so a long section is not re-copied with every chunk
+        keep_from = max(start, limit)
+        pending.append(buffer[start:keep_from])
+        buffer = buffer[keep_from:]
+
+    for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            started = True
+        buffer += chunk
+        if len(buffer) > margin:
+            yield from split_buffer(len(buffer) - margin)
+
+    buffer = buffer.rstrip()
+    yield from split_buffer(len(buffer) + 1)
+    section = ''.join(pending).strip()
+    if section:
+        yield section
+
+def iter_text_chunks(stream: BinaryIO, chunk_size: int = SECTION_STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """Decode a binary file as UTF-8 in fixed-size chunks"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        yield decoder.decode(data)
+    yield decoder.decode(b'', final=True)
+
+def get_section_identifier(section: str) -> str:
+    """Create a consistent identifier for each section"""
+    first_line = section.split('\n', 1)[0].strip()
+    normalized = PUNCTUATION.sub('', first_line.lower())
+    normalized = WHITESPACE.sub(' ', normalized).strip()
+    return normalized[:100]
+
+def split_into_paragraphs(text: str) -> List[str]:
+    """Improved paragraph splitting that handles various formats"""
+    paragraphs = PARAGRAPH_BOUNDARY.split(text.strip())
+    return [p.strip() for p in paragraphs if p.strip() and len(p.strip()) > 10]
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace for similarity comparison"""
+    return WHITESPACE.sub(' ', text.strip().lower())
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_paragraph(paragraph: str) -> str:
+    """normalize_text cached per paragraph"""
+    return normalize_text(paragraph)
+
+def word_tokens(text: str) -> List[str]:
+    """Word tokens of a text"""
+    return WORD.findall(text)
+
+def diff_tokens(text: str) -> List[str]:
+    """Tokens of a text for word-level diffs, covering every character"""
+    return DIFF_TOKEN.findall(text)
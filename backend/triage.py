@@ -0,0 +1,102 @@
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from difference_utility import ParagraphComparisonResult
+from tokenizer import word_tokens
+
+# List markers at the start of a line: "5.", "5.2.", "3)", "(b)", "b)", "IV."
+# Bare numbers are content ("30 days", a fee of "100") and are kept
+LIST_MARKER = re.compile(r'^\s*(?:\d+(?:\.\d+)*[.)]|\(\w{1,4}\)|[a-z][.)]|[ivxlc]+[.)])(?=\s|$)', re.IGNORECASE)
+# Section number at the start of a section's first line: "5.2.1 ", "12 "
+SECTION_NUMBER = re.compile(r'^\s*\d+(?:\.\d+)*\.?(?=\s|$)')
+
+def normalized_tokens(text: str) -> List[str]:
+    """
+    Word tokens with case, punctuation, whitespace, list markers and the section number
+    removed, so sections that differ only cosmetically produce the same sequence
+    """
+    tokens = []
+    for index, line in enumerate(text.splitlines()):
+        if index == 0:
+            line = SECTION_NUMBER.sub('', line)
+        tokens.extend(word_tokens(LIST_MARKER.sub('', line).lower()))
+    return tokens
+
+def is_cosmetic_change(old_content: str, new_content: str,
+                       paragraph_result: Optional[ParagraphComparisonResult] = None) -> bool:
+    """
+    True when a section changed only in whitespace, punctuation, numbering or case.
+    An added or deleted paragraph in the paragraph diff is taken as substantive without
+    running the token comparison; modified paragraphs are not, since the paragraph diff
+    only ignores case and whitespace and reports every punctuation or numbering edit.
+
+    >>> from difference_utility import analyze_paragraph_changes
+    >>> def check(old, new):
+    ...     return is_cosmetic_change(old, new, analyze_paragraph_changes(old, new))
+    >>> check("The bank shall notify the authority within thirty days.",
+    ...       "The bank shall notify the authority, within thirty days;")
+    True
+    >>> check("5.2 Reporting duties\\n\\nThe bank shall report annually to the authority.",
+    ...       "5.3 Reporting duties\\n\\nThe bank shall report annually to the authority.")
+    True
+    >>> check("(a) The bank shall keep records of each transfer.",
+    ...       "(b) The bank shall keep records of each transfer.")
+    True
+    >>> check("The bank shall notify the authority within thirty days.",
+    ...       "The bank may notify the authority within sixty days.")
+    False
+    """
+    if paragraph_result is not None and (
+        paragraph_result.added_paragraphs
+        or paragraph_result.deleted_paragraphs
+    ):
+        return False
+    return normalized_tokens(old_content) == normalized_tokens(new_content)
+
+def cosmetic_analysis(section_id: str) -> Dict:
+    """Local analysis returned in place of an LLM call for cosmetic-only changes"""
+    return {
+        "section_id": section_id,
+        "change_summary": "Formatting, punctuation, numbering or case changes only",
+        "change_type": "Minor Edit",
+        "change_impact": "Low",
+        "triaged": True
+    }
+
+class TriageStats:
+    """Counts sections triaged and LLM calls skipped"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sections = 0
+        self.skipped = 0
+
+    def record(self, sections: int, skipped: int) -> None:
+        with self._lock:
+            self.sections += sections
+            self.skipped += skipped
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sections": self.sections, "llm_calls_skipped": self.skipped}
+
+triage_stats = TriageStats()
+
+def triage_modified_sections(
+    modified_sections: Dict[str, Dict[str, str]],
+    paragraph_results: Optional[Dict[str, ParagraphComparisonResult]] = None
+) -> Tuple[Dict[str, Dict[str, str]], Dict[str, Dict]]:
+    """
+    Split modified sections into those that need the LLM and local analyses of cosmetic-only edits.
+    Returns (substantive_sections, cosmetic_results).
+    """
+    paragraph_results = paragraph_results or {}
+    substantive, cosmetic = {}, {}
+    for section_id, content in modified_sections.items():
+        if is_cosmetic_change(content['old'], content['new'], paragraph_results.get(section_id)):
+            cosmetic[section_id] = cosmetic_analysis(section_id)
+        else:
+            substantive[section_id] = content
+    triage_stats.record(len(modified_sections), len(cosmetic))
+    return substantive, cosmetic
@@ -0,0 +1,196 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import VERSION_STORE_PATH
+from difference_utility import (
+    SectionChange, SectionMove, SectionRename, align_sections, section_fingerprint, section_keys
+)
+from tokenizer import preprocess_text, get_section_identifier
+
+# Fingerprints per IN (...) query, under SQLite's bound-parameter limit (999 on older builds)
+QUERY_CHUNK = 500
+
+def _chunks(items: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(items), QUERY_CHUNK):
+        yield items[start:start + QUERY_CHUNK]
+
+class VersionStore:
+    """
+    SQLite store of parsed regulation revisions.
+    Each version keeps its ordered (identifier, fingerprint) list; section text is stored once
+    per fingerprint, so unchanged sections cost nothing across revisions and a diff only
+    loads the text of sections whose fingerprints differ.
+    """
+
+    def __init__(self, path: str = VERSION_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS versions (
+                regulation_id TEXT NOT NULL,
+                version TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                section_count INTEGER NOT NULL,
+                PRIMARY KEY (regulation_id, version)
+            );
+            CREATE TABLE IF NOT EXISTS version_sections (
+                regulation_id TEXT NOT NULL,
+                version TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                identifier TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                PRIMARY KEY (regulation_id, version, position)
+            );
+            CREATE TABLE IF NOT EXISTS section_contents (
+                fingerprint TEXT PRIMARY KEY,
+                content TEXT NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def add_version(self, regulation_id: str, version: str, text: str) -> Dict:
+        """Parse and store a revision; re-adding an existing version replaces its sections"""
+        sections = [
+            (get_section_identifier(section), section_fingerprint(section), section)
+            for section in preprocess_text(text)
+        ]
+        with self._lock:
+            known = set()
+            for chunk in _chunks(list({fingerprint for _, fingerprint, _ in sections})):
+                known.update(row[0] for row in self._conn.execute(
+                    f"SELECT fingerprint FROM section_contents WHERE fingerprint IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ))
+            new_contents = {
+                fingerprint: content for _, fingerprint, content in sections if fingerprint not in known
+            }
+
+            self._conn.execute(
+                "DELETE FROM version_sections WHERE regulation_id = ? AND version = ?", (regulation_id, version)
+            )
+            # A replaced version keeps its original created_at, and with it its place in the history
+            self._conn.execute(
+                "INSERT INTO versions (regulation_id, version, created_at, section_count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (regulation_id, version) DO UPDATE SET section_count = excluded.section_count",
+                (regulation_id, version, time.time(), len(sections))
+            )
+            self._conn.executemany(
+                "INSERT INTO version_sections (regulation_id, version, position, identifier, fingerprint) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (regulation_id, version, position, identifier, fingerprint)
+                    for position, (identifier, fingerprint, _) in enumerate(sections)
+                ]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO section_contents (fingerprint, content) VALUES (?, ?)",
+                new_contents.items()
+            )
+            self._conn.commit()
+
+        return {
+            "regulation_id": regulation_id,
+            "version": version,
+            "sections": len(sections),
+            "new_sections": len(new_contents)
+        }
+
+    def list_versions(self, regulation_id: str) -> List[Dict]:
+        """Versions of a regulation, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, created_at, section_count FROM versions WHERE regulation_id = ? ORDER BY created_at, rowid",
+                (regulation_id,)
+            ).fetchall()
+        return [
+            {"version": version, "created_at": created_at, "sections": section_count}
+            for version, created_at, section_count in rows
+        ]
+
+    def _fingerprints(self, regulation_id: str, version: str) -> Tuple[List[str], List[str]]:
+        """Ordered section identifiers and fingerprints of a version"""
+        rows = self._conn.execute(
+            "SELECT identifier, fingerprint FROM version_sections WHERE regulation_id = ? AND version = ? ORDER BY position",
+            (regulation_id, version)
+        ).fetchall()
+        if not rows and not self._conn.execute(
+            "SELECT 1 FROM versions WHERE regulation_id = ? AND version = ?", (regulation_id, version)
+        ).fetchone():
+            raise KeyError(f"Unknown version '{version}' of regulation '{regulation_id}'")
+        return [identifier for identifier, _ in rows], [fingerprint for _, fingerprint in rows]
+
+    def _contents(self, fingerprints: set) -> Dict[str, str]:
+        contents = {}
+        for chunk in _chunks(list(fingerprints)):
+            contents.update(self._conn.execute(
+                f"SELECT fingerprint, content FROM section_contents WHERE fingerprint IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall())
+        return contents
+
+    def diff(self, regulation_id: str, from_version: str, to_version: str) -> Dict:
+        """
+        Compare two stored versions with the same alignment as compare_sections, pairing
+        identical fingerprints first. Only sections that differ are loaded.
+        Returns added_sections, deleted_sections, moved_sections, renamed_sections,
+        modified_sections ({section_key: {'old': ..., 'new': ...}}) and the unchanged section count.
+        """
+        with self._lock:
+            old_identifiers, old_fingerprints = self._fingerprints(regulation_id, from_version)
+            new_identifiers, new_fingerprints = self._fingerprints(regulation_id, to_version)
+            contents: Dict[str, str] = {}
+
+            def load(fingerprints: List[str]) -> List[str]:
+                contents.update(self._contents(set(fingerprints) - contents.keys()))
+                return [contents[fingerprint] for fingerprint in fingerprints]
+
+            alignment = align_sections(
+                old_identifiers, old_fingerprints, new_identifiers, new_fingerprints,
+                lambda indices: load([old_fingerprints[i] for i in indices]),
+                lambda indices: load([new_fingerprints[j] for j in indices])
+            )
+            changed = [(i, j) for i, j in alignment.matches if old_fingerprints[i] != new_fingerprints[j]]
+            load([old_fingerprints[i] for i in alignment.deleted] + [old_fingerprints[i] for i, _ in changed])
+            load([new_fingerprints[j] for j in alignment.added] + [new_fingerprints[j] for _, j in changed])
+
+        old_keys = section_keys(old_identifiers)
+        new_keys = section_keys(new_identifiers)
+        return {
+            "added_sections": [
+                SectionChange(title=new_keys[j], content=contents[new_fingerprints[j]]) for j in alignment.added
+            ],
+            "deleted_sections": [
+                SectionChange(title=old_keys[i], content=contents[old_fingerprints[i]]) for i in alignment.deleted
+            ],
+            "moved_sections": [
+                SectionMove(title=new_keys[j], old_position=i, new_position=j) for i, j in alignment.moved
+            ],
+            "renamed_sections": [
+                SectionRename(old_title=old_keys[i], new_title=new_keys[j], similarity=ratio, method=method)
+                for i, j, ratio, method in alignment.renamed
+            ],
+            "modified_sections": {
+                new_keys[j]: {'old': contents[old_fingerprints[i]], 'new': contents[new_fingerprints[j]]}
+                for i, j in changed
+            },
+            "unchanged_sections": len(alignment.matches) - len(changed)
+        }
+
+    def previous_version(self, regulation_id: str, version: str) -> Optional[str]:
+        """The version stored just before the given one, if any"""
+        versions = [entry["version"] for entry in self.list_versions(regulation_id)]
+        if version not in versions:
+            raise KeyError(f"Unknown version '{version}' of regulation '{regulation_id}'")
+        index = versions.index(version)
+        return versions[index - 1] if index > 0 else None
+
+    def latest_version(self, regulation_id: str) -> Optional[str]:
+        versions = self.list_versions(regulation_id)
+        return versions[-1]["version"] if versions else None
+
+version_store = VersionStore()
@@ -0,0 +1,117 @@
+"""
+Micro-benchmark of the precompiled tokenizer against the original inline-regex helpers,
+followed by the peak traced memory of splitting a scaled document whole versus streamed.
+
+    python benchmarks/bench_tokenizer.py [--document text_v2.txt] [--repeat 20] [--memory-scale 100]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+import tokenizer  # noqa: E402
+
+# Original implementations, kept verbatim for comparison
+
+def original_preprocess_text(text):
+    sections = re.split(
+        r'\n(?=\d+\.\d*\s+[A-Z][^\n]+|\n\[SECTION|ARTICLE|\n\s*[A-Z][A-Z\s]+\n|\n\s*[IVX]+\.\s|\n\s*\(\w\)\s)',
+        text.strip()
+    )
+    return [s.strip() for s in sections if s.strip()]
+
+def original_get_section_identifier(section):
+    first_line = section.split('\n')[0].strip()
+    normalized = re.sub(r'[^\w\s]', '', first_line.lower())
+    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    return normalized[:100]
+
+def original_split_into_paragraphs(text):
+    paragraphs = re.split(r'\n\s*\n|\n\s*[\-\*•]\s+', text.strip())
+    return [p.strip() for p in paragraphs if p.strip() and len(p.strip()) > 10]
+
+def original_normalize(paragraph):
+    return re.sub(r'\s+', ' ', paragraph.strip().lower())
+
+def workloads(text):
+    sections = original_preprocess_text(text)
+    paragraphs = [p for s in sections for p in original_split_into_paragraphs(s)][:60]
+    # Capitals-and-whitespace block: the greedy header lookahead rescans it from every newline
+    capitals = "\n\n".join("SHALL COMPLY WITH ALL REQUIREMENTS" for _ in range(2000)) + "\nend"
+
+    def pairwise(normalize):
+        return lambda: [(normalize(a), normalize(b)) for a in paragraphs for b in paragraphs]
+
+    return [
+        ("preprocess_text", lambda: original_preprocess_text(text), lambda: tokenizer.preprocess_text(text)),
+        ("get_section_identifier",
+         lambda: [original_get_section_identifier(s) for s in sections],
+         lambda: [tokenizer.get_section_identifier(s) for s in sections]),
+        ("split_into_paragraphs",
+         lambda: [original_split_into_paragraphs(s) for s in sections],
+         lambda: [tokenizer.split_into_paragraphs(s) for s in sections]),
+        ("normalize (pairwise)", pairwise(original_normalize), pairwise(tokenizer.normalize_paragraph)),
+        ("headers (capitals block)",
+         lambda: original_preprocess_text(capitals), lambda: tokenizer.preprocess_text(capitals)),
+    ]
+
+def peak_memory(run):
+    """Peak traced memory of run() in MB"""
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+def memory_workloads(path):
+    def whole():
+        with open(path, encoding="utf-8") as f:
+            tokenizer.preprocess_text(f.read())
+
+    def streamed():
+        with open(path, "rb") as f:
+            for _ in tokenizer.iter_sections(tokenizer.iter_text_chunks(f)):
+                pass
+
+    return [("preprocess_text (whole)", whole), ("iter_sections (streamed)", streamed)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--document", default=os.path.join(ROOT, "text_v2.txt"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--memory-scale", type=int, default=100,
+                        help="copies of the document to split in the memory comparison (0 skips it)")
+    args = parser.parse_args()
+
+    with open(args.document, encoding="utf-8") as f:
+        text = f.read()
+
+    print(f"{'workload':<26}{'original ms':>14}{'tokenizer ms':>14}{'speedup':>10}")
+    for name, original, optimized in workloads(text):
+        assert original() == optimized(), f"{name}: outputs differ"
+        before = min(timeit.repeat(original, number=1, repeat=args.repeat)) * 1000
+        after = min(timeit.repeat(optimized, number=1, repeat=args.repeat)) * 1000
+        print(f"{name:<26}{before:>14.3f}{after:>14.3f}{before / after:>9.1f}x")
+
+    if args.memory_scale > 0:
+        from run import scale_document
+
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt", delete=False) as f:
+            f.write(scale_document(text, args.memory_scale))
+        try:
+            size = os.path.getsize(f.name) / 2**20
+            print(f"\n{'split ' + format(size, '.1f') + ' MB':<26}{'peak MB':>14}")
+            for name, split in memory_workloads(f.name):
+                print(f"{name:<26}{peak_memory(split):>14.1f}")
+        finally:
+            os.unlink(f.name)
+
+if __name__ == "__main__":
+    main()
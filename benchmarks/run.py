@@ -0,0 +1,235 @@
+"""
+Benchmark harness for the diff and LLM pipeline.
+
+    python benchmarks/run.py --scales 1,10,100 --stub-latency 0.05 --output benchmarks/results.json
+    python benchmarks/run.py --baseline benchmarks/baseline.json   # fail on regressions
+
+Times preprocess_text, compare_sections, analyze_paragraph_changes and the upload endpoints
+against text_v1.txt/text_v2.txt and synthetic corpora built by repeating them N times with
+distinct section headers. LLM endpoints talk to the bundled stub Ollama server, so timings
+cover the pipeline rather than the model. Results are written as JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+sys.path.insert(0, BACKEND)
+
+ENDPOINTS = [
+    "/compare/sections",
+    "/compare/paragraphs",
+    "/added/ai",
+    "/modified/ai",
+    "/added/ai/stream",
+    "/modified/ai/stream",
+]
+AI_ENDPOINTS = {"/added/ai", "/modified/ai", "/added/ai/stream", "/modified/ai/stream"}
+
+def copy_tag(copy: int) -> str:
+    """Uppercase letters distinguishing copy N's section headers (A, B, ..., BA, ...)"""
+    letters = ""
+    while True:
+        copy, digit = divmod(copy, 26)
+        letters = chr(ord("A") + digit) + letters
+        if copy == 0:
+            return "COPY " + letters
+
+def scale_document(text: str, scale: int) -> str:
+    """
+    Repeat a document's sections `scale` times. Copies after the first get a tag appended to
+    their header line, so every copy keeps distinct section identifiers and header detection.
+    """
+    from tokenizer import preprocess_text
+
+    if scale == 1:
+        return text
+    sections = preprocess_text(text)
+    copies = [text.strip()]
+    for copy in range(1, scale):
+        tagged = []
+        for section in sections:
+            header, _, body = section.partition("\n")
+            tagged.append(f"{header} {copy_tag(copy)}\n{body}" if body else f"{header} {copy_tag(copy)}")
+        copies.append("\n\n".join(tagged))
+    return "\n\n".join(copies)
+
+def measure(func: Callable[[], object], repeat: int, setup: Optional[Callable[[], None]] = None) -> Dict:
+    """Time func `repeat` times, calling setup untimed before each run"""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "runs": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "max": max(timings),
+    }
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(args) -> Dict:
+    from stub_ollama import StubOllamaServer
+
+    stub = StubOllamaServer(latency=args.stub_latency, jitter=args.stub_jitter,
+                            token_latency=args.stub_token_latency, ramble=args.stub_ramble).start()
+    scratch = tempfile.mkdtemp(prefix="regdiff-bench-")
+    # Backend modules read these at import time
+    os.environ["OLLAMA_API_URL"] = stub.url
+    os.environ["LLM_CACHE_PATH"] = os.path.join(scratch, "llm_cache.sqlite3")
+    os.environ["VERSION_STORE_PATH"] = os.path.join(scratch, "versions.sqlite3")
+    if args.similarity_backend:
+        os.environ["SIMILARITY_BACKEND"] = args.similarity_backend
+
+    from fastapi.testclient import TestClient
+    from cache import comparison_cache
+    from difference_utility import compare_sections, analyze_paragraph_changes, get_changed_sections
+    from executors import shutdown_pools
+    from similarity import similarity_backend
+    from tokenizer import preprocess_text, normalize_paragraph
+    import main
+
+    def cold():
+        comparison_cache.clear()
+        normalize_paragraph.cache_clear()
+
+    with open(os.path.join(ROOT, "text_v1.txt"), encoding="utf-8") as f:
+        base_old = f.read()
+    with open(os.path.join(ROOT, "text_v2.txt"), encoding="utf-8") as f:
+        base_new = f.read()
+
+    results: List[Dict] = []
+
+    def record(kind: str, name: str, scale: int, timing: Dict, **extra) -> None:
+        entry = {"kind": kind, "name": name, "scale": scale, **timing, **extra}
+        results.append(entry)
+        print(f"{kind:<9}{name:<28}{scale:>5}x  median {timing['median'] * 1000:>10.1f} ms", flush=True)
+
+    try:
+        with TestClient(main.app) as client:
+            for scale in args.scales:
+                old_text = scale_document(base_old, scale)
+                new_text = scale_document(base_new, scale)
+                size = {"old_bytes": len(old_text.encode()), "new_bytes": len(new_text.encode())}
+                comparison = compare_sections(old_text, new_text)
+                changed = get_changed_sections(comparison)
+
+                record("function", "preprocess_text", scale,
+                       measure(lambda: preprocess_text(new_text), args.repeat), **size)
+                record("function", "compare_sections", scale,
+                       measure(lambda: compare_sections(old_text, new_text), args.repeat), **size)
+                record("function", "analyze_paragraph_changes", scale,
+                       measure(lambda: [analyze_paragraph_changes(old, new) for _, old, new in changed],
+                               args.repeat, setup=normalize_paragraph.cache_clear),
+                       sections=len(changed), **size)
+
+                files = lambda: {
+                    "old_version": ("old.txt", old_text.encode()),
+                    "new_version": ("new.txt", new_text.encode()),
+                }
+                for endpoint in args.endpoints:
+                    if endpoint in AI_ENDPOINTS and scale > args.ai_max_scale:
+                        continue
+
+                    def call():
+                        response = client.post(endpoint, files=files(), params={"bypass_cache": "true"})
+                        response.raise_for_status()
+
+                    requests_before, tokens_before = stub.requests, stub.tokens
+                    timing = measure(call, args.repeat, setup=cold)
+                    record("endpoint", endpoint, scale, timing,
+                           llm_requests=(stub.requests - requests_before) // args.repeat,
+                           llm_tokens=(stub.tokens - tokens_before) // args.repeat, **size)
+    finally:
+        shutdown_pools()
+        stub.stop()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "similarity_backend": similarity_backend.name,
+            "stub_latency": args.stub_latency,
+            "stub_jitter": args.stub_jitter,
+            "stub_token_latency": args.stub_token_latency,
+            "stub_ramble": args.stub_ramble,
+            "llm_stream": os.environ.get("LLM_STREAM", "1") == "1",
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+def compare_with_baseline(report: Dict, baseline_path: str, threshold: float) -> bool:
+    """Print median ratios against a baseline report; False if any exceeds threshold"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {
+            (entry["kind"], entry["name"], entry["scale"]): entry for entry in json.load(f)["results"]
+        }
+    ok = True
+    print(f"\nAgainst {baseline_path} (regression threshold {threshold:.2f}x):")
+    for entry in report["results"]:
+        previous = baseline.get((entry["kind"], entry["name"], entry["scale"]))
+        if not previous:
+            continue
+        ratio = entry["median"] / previous["median"] if previous["median"] else float("inf")
+        flag = "REGRESSION" if ratio > threshold else ""
+        ok = ok and not flag
+        print(f"  {entry['name']:<28}{entry['scale']:>5}x  {ratio:>6.2f}x  {flag}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the diff and LLM pipeline")
+    parser.add_argument("--scales", default="1,10,100",
+                        type=lambda value: [int(scale) for scale in value.split(",")],
+                        help="comma-separated corpus multipliers")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), type=lambda value: value.split(","),
+                        help="comma-separated endpoints to time (empty string for none)")
+    parser.add_argument("--ai-max-scale", type=int, default=10,
+                        help="largest scale at which the LLM endpoints are timed")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="stub LLM seconds per request")
+    parser.add_argument("--stub-jitter", type=float, default=0.0, help="extra random stub seconds per request")
+    parser.add_argument("--stub-token-latency", type=float, default=0.0,
+                        help="stub LLM seconds per generated chunk")
+    parser.add_argument("--stub-ramble", type=int, default=0,
+                        help="chunks the stub LLM generates after the JSON object")
+    parser.add_argument("--similarity-backend", help="override SIMILARITY_BACKEND")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results.json"))
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="median slowdown versus the baseline counted as a regression")
+    args = parser.parse_args()
+    args.endpoints = [endpoint for endpoint in args.endpoints if endpoint]
+
+    report = run_benchmarks(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.baseline and not compare_with_baseline(report, args.baseline, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
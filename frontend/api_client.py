@@ -1,3 +1,5 @@
+import json
+import time
 import requests
 
 BASE_URL = "http://localhost:8000"
@@ -32,4 +34,105 @@ def analyze_modified_sections(old_file, new_file):
         "new_version": ("new.txt", new_file.getvalue())
     }
     response = requests.post(f"{BASE_URL}/modified/ai", files=files)
-    return response.json() if response.status_code == 200 else None
\ No newline at end of file
+    return response.json() if response.status_code == 200 else None
+
+def _iter_ndjson(response):
+    with response:
+        if response.status_code != 200:
+            return
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+def _stream_ndjson(endpoint, old_file, new_file):
+    files = {
+        "old_version": ("old.txt", old_file.getvalue()),
+        "new_version": ("new.txt", new_file.getvalue())
+    }
+    yield from _iter_ndjson(requests.post(f"{BASE_URL}{endpoint}", files=files, stream=True))
+
+def stream_added_sections(old_file, new_file):
+    """Yield each added section's analysis as soon as the backend completes it"""
+    yield from _stream_ndjson("/added/ai/stream", old_file, new_file)
+
+def stream_modified_sections(old_file, new_file):
+    """Yield each modified section's analysis as soon as the backend completes it"""
+    yield from _stream_ndjson("/modified/ai/stream", old_file, new_file)
+
+# Session API: upload the documents once and fetch each analysis stage by comparison ID
+
+def create_comparison(old_file, new_file):
+    """Upload both documents once and return the comparison ID"""
+    files = {
+        "old_version": ("old.txt", old_file.getvalue()),
+        "new_version": ("new.txt", new_file.getvalue())
+    }
+    response = requests.post(f"{BASE_URL}/analyze", files=files)
+    return response.json()["comparison_id"] if response.status_code == 200 else None
+
+def comparison_exists(comparison_id):
+    response = requests.get(f"{BASE_URL}/analyze/{comparison_id}")
+    return response.status_code == 200
+
+def get_stage(comparison_id, stage, params=None):
+    """Fetch one of "sections", "paragraphs", "added_ai" or "modified_ai" for a comparison"""
+    response = requests.get(f"{BASE_URL}/analyze/{comparison_id}/{stage}", params=params)
+    return response.json() if response.status_code == 200 else None
+
+def stream_stage(comparison_id, stage):
+    """Yield "added_ai" or "modified_ai" results for a comparison as they complete"""
+    yield from _iter_ndjson(requests.get(f"{BASE_URL}/analyze/{comparison_id}/{stage}/stream", stream=True))
+
+def get_contents(content_hashes):
+    """Texts behind the "..._ref" entries of a compact response, as {content_hash: text}"""
+    response = requests.post(f"{BASE_URL}/content", json=list(content_hashes))
+    return response.json() if response.status_code == 200 else {}
+
+# Background jobs: start an AI analysis and poll for progress instead of holding a request open
+
+def submit_job(comparison_id, stage, bypass_cache=False):
+    """Start an "added_ai" or "modified_ai" job for a comparison and return its job ID"""
+    response = requests.post(
+        f"{BASE_URL}/analyze/{comparison_id}/jobs/{stage}", params={"bypass_cache": bypass_cache}
+    )
+    return response.json()["job_id"] if response.status_code == 202 else None
+
+def submit_batch(documents, manifest=None, ai=False, diff_only=False):
+    """
+    Start a batch comparison of {name: bytes} documents and return its job ID.
+    manifest is a list of {"id", "old", "new"} entries; without it, documents sharing a
+    folder in their name are compared as successive versions.
+    """
+    files = [("documents", (name, data)) for name, data in documents.items()]
+    data = {"manifest": json.dumps(manifest)} if manifest is not None else None
+    response = requests.post(
+        f"{BASE_URL}/batch", files=files, data=data, params={"ai": ai, "diff_only": diff_only}
+    )
+    return response.json()["job_id"] if response.status_code == 202 else None
+
+def get_job(job_id):
+    """Job status, progress {"done", "total"} and, once done, "result" """
+    response = requests.get(f"{BASE_URL}/jobs/{job_id}")
+    return response.json() if response.status_code == 200 else None
+
+def cancel_job(job_id):
+    response = requests.delete(f"{BASE_URL}/jobs/{job_id}")
+    return response.json() if response.status_code == 200 else None
+
+def wait_for_job(job_id, poll_interval=1.0, timeout=None, on_progress=None):
+    """
+    Poll a job until it finishes and return its final state, or None if it expired.
+    on_progress(done, total) is called after every poll; on timeout the job is cancelled.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        job = get_job(job_id)
+        if job is None:
+            return None
+        if on_progress:
+            on_progress(job["progress"]["done"], job["progress"]["total"])
+        if job["status"] in ("done", "failed", "cancelled"):
+            return job
+        if deadline and time.monotonic() > deadline:
+            return cancel_job(job_id)
+        time.sleep(poll_interval)
@@ -1,3 +1,13 @@
+def format_added_ai_section(section):
+    output = []
+    output.append(f"#### Section : {section['section_title']}")
+    output.append(f"**Content:**\n{section['section_content']}")
+    output.append(f"**Analysis:**")
+    output.append(f"- Summary: {section['analysis']['change_summary']}")
+    output.append(f"- Type: {section['analysis']['change_type']}")
+    output.append("---")
+    return "\n\n".join(output)
+
 def format_added_ai(data):
     if not data:
         return "No AI analysis available for added sections."
@@ -5,11 +15,6 @@ def format_added_ai(data):
     output = ["### 🤖 AI Analysis of Added Sections"]
     
     for section in data:
-        output.append(f"#### Section : {section['section_title']}")
-        output.append(f"**Content:**\n{section['section_content']}")
-        output.append(f"**Analysis:**")
-        output.append(f"- Summary: {section['analysis']['change_summary']}")
-        output.append(f"- Type: {section['analysis']['change_type']}")
-        output.append("---")
+        output.append(format_added_ai_section(section))
     
     return "\n\n".join(output)
\ No newline at end of file
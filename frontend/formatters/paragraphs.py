@@ -1,3 +1,30 @@
+def _emphasize(text, marker):
+    """Wrap text in a markdown marker, keeping surrounding whitespace outside it"""
+    stripped = text.strip()
+    if not stripped:
+        return text
+    start = text.index(stripped)
+    return f"{text[:start]}{marker}{stripped}{marker}{text[start + len(stripped):]}"
+
+def format_inline_diff(old_paragraph, diff):
+    """
+    One paragraph with deletions struck through and insertions in bold, from the
+    old text and its word-level diff spans ["=", length], ["-", text], ["+", text]
+    """
+    parts = []
+    position = 0
+    for op, value in diff:
+        if op == "=":
+            parts.append(old_paragraph[position:position + value])
+            position += value
+        elif op == "-":
+            parts.append(_emphasize(value, "~~"))
+            position += len(value)
+        else:
+            parts.append(_emphasize(value, "**"))
+    # Keep the block quote across line breaks
+    return "".join(parts).replace("\n", "\n> ")
+
 def format_paragraphs(data):
     if not data:
         return "No paragraph changes detected in modified sections."
@@ -11,10 +38,13 @@ def format_paragraphs(data):
             output.append("#### Modified Paragraphs")
             for para in changes['modified_paragraphs']:
                 output.append(f"**Similarity:** {para['similarity']:.0%}")
-                output.append("**Old version:**")
-                output.append(f"> {para['old_paragraph']}")
-                output.append("**New version:**")
-                output.append(f"> {para['new_paragraph']}")
+                if para.get('diff') is not None:
+                    output.append(f"> {format_inline_diff(para['old_paragraph'], para['diff'])}")
+                else:
+                    output.append("**Old version:**")
+                    output.append(f"> {para['old_paragraph']}")
+                    output.append("**New version:**")
+                    output.append(f"> {para['new_paragraph']}")
                 output.append("---")
         
         if changes['added_paragraphs']:
@@ -16,6 +16,22 @@ def format_sections(data):
             output.append(f"~~{section['title']}~~")
             output.append(f"```\n{section['content']}\n```")
     
+    if data.get('renamed_sections'):
+        output.append("### Renamed Sections")
+        for section in data['renamed_sections']:
+            output.append(
+                f"~~{section['old_title']}~~ → **{section['new_title']}** "
+                f"(similarity: {section['similarity']:.2f}"
+                f"{', semantic match' if section.get('method') == 'semantic' else ''})"
+            )
+    
+    if data.get('moved_sections'):
+        output.append("### Moved Sections")
+        for section in data['moved_sections']:
+            output.append(
+                f"**{section['title']}**: position {section['old_position'] + 1} → {section['new_position'] + 1}"
+            )
+    
     if not output:
         return "No significant changes between sections"
     
@@ -2,8 +2,8 @@ import streamlit as st
 from api_client import *
 from formatters.sections import format_sections
 from formatters.paragraphs import format_paragraphs
-from formatters.added_ai import format_added_ai
-from formatters.modified_ai import format_modified_ai
+from formatters.added_ai import format_added_ai, format_added_ai_section
+from formatters.modified_ai import format_modified_ai, format_modified_ai_section
 
 # Page configuration
 st.set_page_config(
@@ -25,6 +25,21 @@ if 'results' not in st.session_state:
 if 'current_step' not in st.session_state:
     st.session_state.current_step = 0
 
+if 'comparison' not in st.session_state:
+    st.session_state.comparison = {'files': None, 'id': None}
+
+def get_comparison_id(old_file, new_file):
+    """
+    Upload the document pair once per session and reuse its comparison ID for every step,
+    re-uploading only when the files change or the backend has expired the comparison
+    """
+    files_key = (old_file.file_id, new_file.file_id)
+    comparison = st.session_state.comparison
+    if comparison['files'] != files_key or not comparison['id'] or not comparison_exists(comparison['id']):
+        comparison['id'] = create_comparison(old_file, new_file)
+        comparison['files'] = files_key
+    return comparison['id']
+
 # Header with styling
 st.markdown("""
 <div style="text-align: center; padding: 2rem 0;">
@@ -116,7 +131,7 @@ if old_file and new_file:
         
         if st.button(button_text, use_container_width=True, type=button_type, disabled=step1_disabled or step1_completed):
             with st.spinner("Comparing sections..."):
-                st.session_state.results['sections'] = compare_sections(old_file, new_file)
+                st.session_state.results['sections'] = get_stage(get_comparison_id(old_file, new_file), 'sections')
                 st.session_state.current_step = 1
             st.success("Section comparison completed!")
             st.rerun()
@@ -131,7 +146,9 @@ if old_file and new_file:
         
         if st.button(button_text, use_container_width=True, type=button_type, disabled=step2_disabled or step2_completed):
             with st.spinner("Comparing paragraphs..."):
-                st.session_state.results['paragraphs'] = compare_paragraphs(old_file, new_file)
+                st.session_state.results['paragraphs'] = get_stage(
+                    get_comparison_id(old_file, new_file), 'paragraphs', params={'diff_only': True}
+                )
                 st.session_state.current_step = 2
             st.success("Paragraph comparison completed!")
             st.rerun()
@@ -145,9 +162,17 @@ if old_file and new_file:
         button_type = "secondary" if step3_completed else "primary"
         
         if st.button(button_text, use_container_width=True, type=button_type, disabled=step3_disabled or step3_completed):
-            with st.spinner("Analyzing added sections..."):
-                st.session_state.results['added_ai'] = analyze_added_sections(old_file, new_file)
-                st.session_state.current_step = 3
+            # Show each section's analysis as soon as the backend streams it
+            progress = st.progress(0.0, text="Analyzing added sections...")
+            live_results = st.container()
+            added_results = []
+            for item in stream_stage(get_comparison_id(old_file, new_file), 'added_ai'):
+                added_results.append(item)
+                progress.progress(len(added_results) / item['total'], text=f"Analyzed {len(added_results)} of {item['total']} added sections")
+                live_results.markdown(format_added_ai_section(item))
+            added_results.sort(key=lambda item: item['index'])
+            st.session_state.results['added_ai'] = added_results
+            st.session_state.current_step = 3
             st.success("Added sections analysis completed!")
             st.rerun()
     
@@ -160,9 +185,17 @@ if old_file and new_file:
         button_type = "secondary" if step4_completed else "primary"
         
         if st.button(button_text, use_container_width=True, type=button_type, disabled=step4_disabled or step4_completed):
-            with st.spinner("Analyzing modified sections..."):
-                st.session_state.results['modified_ai'] = analyze_modified_sections(old_file, new_file)
-                st.session_state.current_step = 4
+            # Show each section's analysis as soon as the backend streams it
+            progress = st.progress(0.0, text="Analyzing modified sections...")
+            live_results = st.container()
+            modified_results = []
+            for item in stream_stage(get_comparison_id(old_file, new_file), 'modified_ai'):
+                modified_results.append(item)
+                progress.progress(len(modified_results) / item['total'], text=f"Analyzed {len(modified_results)} of {item['total']} modified sections")
+                live_results.markdown(format_modified_ai_section(item['section_id'], item))
+            modified_results.sort(key=lambda item: item['index'])
+            st.session_state.results['modified_ai'] = {item['section_id']: item for item in modified_results}
+            st.session_state.current_step = 4
             st.success("Modified sections analysis completed!")
             st.rerun()
     